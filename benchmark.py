@@ -0,0 +1,419 @@
+"""Бенчмарки горячих путей бота.
+
+Запуск:
+    python benchmark.py zip [--tracks 100] [--size-mb 3]
+    python benchmark.py lag [--tracks 40] [--size-mb 3]
+    python benchmark.py db [--queries 2000] [--concurrency 8]
+    python benchmark.py history [--rows 1000000] [--users 10000] [--queries 200]
+    python benchmark.py cache [--tracks 1000 5000] [--playlists 200]
+    python benchmark.py ydl [--calls 200]
+    python benchmark.py executors [--downloads 60] [--searches 20]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+def make_fake_tracks(directory, tracks, size_mb):
+    """Создает "треки" из случайных байт — по сжимаемости они как MP3"""
+    for i in range(tracks):
+        with open(os.path.join(directory, f"Track {i + 1:03d}.mp3"), 'wb') as f:
+            f.write(os.urandom(int(size_mb * 1024 * 1024)))
+
+def bench_zip(args):
+    from services.file_processor import create_zip_parts
+
+    src = tempfile.mkdtemp(prefix="bench_src_")
+    out = tempfile.mkdtemp(prefix="bench_zip_")
+    try:
+        print(f"📦 {args.tracks} треков по {args.size_mb}MB")
+        make_fake_tracks(src, args.tracks, args.size_mb)
+
+        for mode in ('deflated', 'stored', 'auto', 'sample'):
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            parts = create_zip_parts(src, os.path.join(out, mode), 45 * 1024 * 1024, mode)
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            size_mb = sum(os.path.getsize(p) for p in parts) / 1024 / 1024
+            print(f"• {mode:<9} время: {wall:6.2f}с  CPU: {cpu:6.2f}с  частей: {len(parts)}  размер: {size_mb:.1f}MB")
+            for part in parts:
+                os.remove(part)
+    finally:
+        shutil.rmtree(src, ignore_errors=True)
+        shutil.rmtree(out, ignore_errors=True)
+
+async def measure_loop_lag(work, interval=0.01):
+    """Выполняет work() и параллельно меряет задержки цикла событий"""
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not done.is_set():
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lags.append(loop.time() - start - interval)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(interval * 2)
+    try:
+        await work()
+    finally:
+        done.set()
+        await task
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    return (lags[-1] if lags else 0.0), p99
+
+def bench_lag(args):
+    from services.file_processor import create_zip_parts, file_processor
+
+    src = tempfile.mkdtemp(prefix="bench_src_")
+    out = tempfile.mkdtemp(prefix="bench_zip_")
+    try:
+        print(f"⏱ {args.tracks} треков по {args.size_mb}MB, архив deflated")
+        make_fake_tracks(src, args.tracks, args.size_mb)
+
+        async def blocking():
+            create_zip_parts(src, os.path.join(out, "sync"), 45 * 1024 * 1024, "deflated")
+
+        async def offloaded():
+            await file_processor.create_zip_parts_async(src, os.path.join(out, "async"), 45 * 1024 * 1024, "deflated")
+
+        for name, work in (("в цикле событий", blocking), ("в пуле потоков", offloaded)):
+            max_lag, p99 = asyncio.run(measure_loop_lag(work))
+            print(f"• {name:<16} макс. задержка: {max_lag * 1000:8.1f}мс  p99: {p99 * 1000:8.1f}мс")
+    finally:
+        shutil.rmtree(src, ignore_errors=True)
+        shutil.rmtree(out, ignore_errors=True)
+
+def bench_db(args):
+    import aiosqlite
+    import database
+
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    database.DB_PATH = os.path.join(workdir, "bot.db")
+
+    async def per_call(user_id):
+        # Как было раньше: новое соединение на каждый запрос
+        async with aiosqlite.connect(database.DB_PATH) as conn:
+            cursor = await conn.execute('SELECT language FROM users WHERE user_id = ?', (user_id,))
+            await cursor.fetchone()
+
+    async def run():
+        db = database.Database()
+
+        async def pooled(user_id):
+            async with db._connection() as conn:
+                cursor = await conn.execute('SELECT language FROM users WHERE user_id = ?', (user_id,))
+                await cursor.fetchone()
+
+        await db.init_db()
+        for user_id in range(100):
+            await db.add_user(user_id, f"user{user_id}", "Bench", "User", "ua")
+        await db.flush()
+
+        async def measure(query):
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies = []
+
+            async def one(i):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await query(i % 100)
+                    latencies.append(time.perf_counter() - start)
+
+            wall_start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.queries)))
+            wall = time.perf_counter() - wall_start
+            latencies.sort()
+            return wall, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+        variants = (
+            ("соединение на запрос", per_call),
+            ("пул соединений", pooled),
+            ("кэш языков", db.get_user_language),
+        )
+        for name, query in variants:
+            wall, p50, p99 = await measure(query)
+            print(
+                f"• {name:<20} {args.queries / wall:8.0f} запросов/с  "
+                f"p50: {p50 * 1000:6.2f}мс  p99: {p99 * 1000:6.2f}мс"
+            )
+        await db.close()
+
+    try:
+        print(f"🗄 {args.queries} запросов языка, параллельно {args.concurrency}")
+        asyncio.run(run())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_history(args):
+    import random
+    import sqlite3
+    import database
+
+    workdir = tempfile.mkdtemp(prefix="bench_history_")
+    database.DB_PATH = os.path.join(workdir, "bot.db")
+
+    def fill():
+        conn = sqlite3.connect(database.DB_PATH)
+        conn.execute('''
+            CREATE TABLE download_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                playlist_url TEXT,
+                playlist_title TEXT,
+                tracks_count INTEGER,
+                file_size_mb REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        rows = (
+            (
+                random.randrange(args.users),
+                f"https://soundcloud.com/artist/sets/{random.randrange(args.users * 5)}",
+                "Playlist",
+                random.randint(1, 50),
+                random.uniform(1, 300),
+                f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 12:00:00",
+            )
+            for _ in range(args.rows)
+        )
+        conn.executemany('''
+            INSERT INTO download_history (user_id, playlist_url, playlist_title, tracks_count, file_size_mb, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+        conn.close()
+
+    def measure():
+        conn = sqlite3.connect(database.DB_PATH)
+        results = {}
+        for name, (sql, _) in database.HOT_QUERIES.items():
+            rng = random.Random(1)
+            start = time.perf_counter()
+            for _ in range(args.queries):
+                user_id = rng.randrange(args.users)
+                if name == 'is_playlist_downloaded':
+                    params = (user_id, f"https://soundcloud.com/artist/sets/{rng.randrange(args.users * 5)}")
+                else:
+                    params = (user_id, 5)
+                conn.execute(sql, params).fetchall()
+            results[name] = (time.perf_counter() - start) / args.queries
+        conn.close()
+        return results
+
+    def measure_totals():
+        """Глобальная статистика: агрегат по всей истории против таблицы итогов"""
+        conn = sqlite3.connect(database.DB_PATH)
+        results = {}
+        for name, sql in (
+            ("агрегат", "SELECT COUNT(*), SUM(tracks_count), SUM(file_size_mb) FROM download_history"),
+            ("итоги", "SELECT users, downloads, tracks, size_mb FROM global_totals WHERE id = 1"),
+        ):
+            start = time.perf_counter()
+            for _ in range(20):
+                conn.execute(sql).fetchall()
+            results[name] = (time.perf_counter() - start) / 20
+        conn.close()
+        return results
+
+    async def migrate():
+        db = database.Database()
+        await db.init_db()
+        plans = await db.explain_query_plans()
+        await db.close()
+        return plans
+
+    try:
+        print(f"📚 {args.rows} строк истории, {args.users} юзеров")
+        fill()
+        before = measure()
+        plans = asyncio.run(migrate())
+        after = measure()
+
+        for name in database.HOT_QUERIES:
+            print(
+                f"• {name:<24} без индексов: {before[name] * 1000:8.2f}мс  "
+                f"с индексами: {after[name] * 1000:6.3f}мс  x{before[name] / after[name]:.0f}"
+            )
+            print(f"    план: {'; '.join(plans[name])}")
+
+        totals = measure_totals()
+        print(
+            f"• {'get_global_statistics':<24} агрегат: {totals['агрегат'] * 1000:8.2f}мс  "
+            f"итоги: {totals['итоги'] * 1000:6.3f}мс"
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_cache(args):
+    import json
+    import random
+    import sqlite3
+    from database import decode_cache_blob, encode_cache_blob
+
+    words = ("Night", "Drive", "Remix", "Love", "Bass", "Dream", "feat.", "Original", "Mix", "City", "Lights", "Deep")
+    rng = random.Random(1)
+
+    def make_playlist(tracks):
+        content_info = {
+            'type': 'playlist', 'title': 'Benchmark Playlist', 'cover_url': 'https://i1.sndcdn.com/artworks-000-t500x500.jpg',
+            'track_count': tracks, 'user': 'Benchmark Artist', 'url': 'https://soundcloud.com/artist/sets/bench',
+        }
+        titles = [{'title': f"Artist {rng.randrange(500)} - {' '.join(rng.choices(words, k=4))}"} for _ in range(tracks)]
+        return content_info, titles
+
+    def decode_time(blob, repeat=50):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decode_cache_blob(blob)
+        return (time.perf_counter() - start) / repeat
+
+    for tracks in args.tracks:
+        content_info, titles = make_playlist(tracks)
+        legacy = json.dumps(titles)
+        compact = encode_cache_blob(titles)
+        assert decode_cache_blob(compact) == titles and decode_cache_blob(legacy) == titles
+        print(
+            f"• {tracks} треков  JSON: {len(legacy.encode()) / 1024:7.1f}KB {decode_time(legacy) * 1000:6.2f}мс  "
+            f"сжатый: {len(compact) / 1024:6.1f}KB {decode_time(compact) * 1000:6.2f}мс"
+        )
+
+        # Попадание превью: раньше декодировались обе колонки, теперь только content_info
+        legacy_hit = decode_time(json.dumps(content_info)) + decode_time(legacy)
+        compact_hit = decode_time(encode_cache_blob(content_info))
+        print(f"  попадание превью  было: {legacy_hit * 1000:6.3f}мс  стало: {compact_hit * 1000:6.3f}мс")
+
+    workdir = tempfile.mkdtemp(prefix="bench_cache_")
+    try:
+        for name, encode in (("JSON", json.dumps), ("сжатый", encode_cache_blob)):
+            path = os.path.join(workdir, f"{name}.db")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE playlist_cache (playlist_url TEXT PRIMARY KEY, playlist_data TEXT, tracks_data TEXT)")
+            for i in range(args.playlists):
+                content_info, titles = make_playlist(args.tracks[0])
+                conn.execute(
+                    "INSERT INTO playlist_cache VALUES (?, ?, ?)",
+                    (f"https://soundcloud.com/artist/sets/{i}", encode(content_info), encode(titles))
+                )
+            conn.commit()
+            conn.execute("VACUUM")
+            conn.close()
+            print(f"• файл БД, {args.playlists} плейлистов по {args.tracks[0]}: {name:<7} {os.path.getsize(path) / 1024 / 1024:6.2f}MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_ydl(args):
+    import yt_dlp
+    from services.ydl_pool import PROFILES, SOUNDCLOUD_IE_KEYS, YDLPool
+
+    # Без сети: меряется только подготовка экземпляра к вызову extract_info
+    opts, _ = PROFILES['flat']
+
+    def fresh():
+        ydl = yt_dlp.YoutubeDL(dict(opts))
+        ydl.get_info_extractor(SOUNDCLOUD_IE_KEYS[0]).initialize()
+        ydl.close()
+
+    pool = YDLPool()
+    pool.warm_up(refresh_client_id=False)
+
+    def pooled():
+        with pool.checkout('flat'):
+            pass
+
+    for name, func in (("новый YoutubeDL", fresh), ("пул", pooled)):
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            func()
+        elapsed = (time.perf_counter() - start) / args.calls
+        print(f"• {name:<16} {elapsed * 1000:8.3f}мс на вызов")
+
+def bench_executors(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from services.executors import WorkloadExecutor
+
+    # Загрузка трека и поиск имитируются блокирующим sleep в потоке
+    def download():
+        time.sleep(args.download_seconds)
+
+    def search():
+        time.sleep(args.search_seconds)
+
+    async def measure(download_pool, search_pool):
+        loop = asyncio.get_running_loop()
+        downloads = [loop.run_in_executor(download_pool, download) for _ in range(args.downloads)]
+        await asyncio.sleep(0.05)
+
+        latencies = []
+        for _ in range(args.searches):
+            start = time.perf_counter()
+            await loop.run_in_executor(search_pool, search)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.05)
+
+        await asyncio.gather(*downloads)
+        latencies.sort()
+        return latencies[len(latencies) // 2], latencies[-1]
+
+    shared = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4))
+    dedicated = (WorkloadExecutor("bench_download", args.download_workers), WorkloadExecutor("bench_search", 4))
+    for name, pools in (("общий пул", (shared, shared)), ("отдельные пулы", dedicated)):
+        median, worst = asyncio.run(measure(*pools))
+        print(f"• {name:<15} поиск во время загрузок: медиана {median * 1000:7.1f}мс  худший {worst * 1000:7.1f}мс")
+    for pool in (shared,) + dedicated:
+        pool.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    zip_parser = commands.add_parser("zip", help="архивация плейлиста разными режимами сжатия")
+    zip_parser.add_argument("--tracks", type=int, default=100)
+    zip_parser.add_argument("--size-mb", type=float, default=3)
+    zip_parser.set_defaults(func=bench_zip)
+
+    lag_parser = commands.add_parser("lag", help="задержка цикла событий во время архивации")
+    lag_parser.add_argument("--tracks", type=int, default=40)
+    lag_parser.add_argument("--size-mb", type=float, default=3)
+    lag_parser.set_defaults(func=bench_lag)
+
+    db_parser = commands.add_parser("db", help="задержка запросов к БД: соединение на запрос против пула")
+    db_parser.add_argument("--queries", type=int, default=2000)
+    db_parser.add_argument("--concurrency", type=int, default=8)
+    db_parser.set_defaults(func=bench_db)
+
+    history_parser = commands.add_parser("history", help="горячие запросы к истории до и после индексов")
+    history_parser.add_argument("--rows", type=int, default=1_000_000)
+    history_parser.add_argument("--users", type=int, default=10_000)
+    history_parser.add_argument("--queries", type=int, default=200)
+    history_parser.set_defaults(func=bench_history)
+
+    cache_parser = commands.add_parser("cache", help="размер и декодирование кэша плейлистов: JSON против сжатого")
+    cache_parser.add_argument("--tracks", type=int, nargs="+", default=[1000, 5000])
+    cache_parser.add_argument("--playlists", type=int, default=200)
+    cache_parser.set_defaults(func=bench_cache)
+
+    ydl_parser = commands.add_parser("ydl", help="подготовка yt-dlp к вызову: новый экземпляр против пула")
+    ydl_parser.add_argument("--calls", type=int, default=200)
+    ydl_parser.set_defaults(func=bench_ydl)
+
+    executors_parser = commands.add_parser("executors", help="задержка поиска во время загрузок: общий пул потоков против отдельных")
+    executors_parser.add_argument("--downloads", type=int, default=60)
+    executors_parser.add_argument("--download-seconds", type=float, default=1.0)
+    executors_parser.add_argument("--download-workers", type=int, default=24)
+    executors_parser.add_argument("--searches", type=int, default=20)
+    executors_parser.add_argument("--search-seconds", type=float, default=0.05)
+    executors_parser.set_defaults(func=bench_executors)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
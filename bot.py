@@ -14,6 +14,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def log_warm_up_result(future):
+    if not future.cancelled() and future.exception():
+        logger.error(f"⚠️ Не удалось прогреть пул YoutubeDL: {future.exception()}")
+
 async def main():
     BOT_TOKEN = os.environ.get("BOT_TOKEN", "").strip()
     
@@ -34,6 +38,19 @@ async def main():
         bot_info = await bot.get_me()
         logger.info(f"✅ Бот авторизован: @{bot_info.username} (ID: {bot_info.id})")
         
+        # 🔥 БАЗА ДАННЫХ: пул соединений живет все время работы бота
+        from database import db
+        from core import db_manager
+        from services import playlist_preview, ydl_pool
+        from services.executors import preview_executor, shutdown_executors
+        await db.init_db()
+        db_manager.set_db(db)
+        playlist_preview.set_db(db)
+        
+        # 🔥 ПУЛ YT-DLP: экземпляры и client_id SoundCloud готовятся в фоне до первых запросов
+        ydl_warm_up = asyncio.get_running_loop().run_in_executor(preview_executor, ydl_pool.warm_up)
+        ydl_warm_up.add_done_callback(log_warm_up_result)
+        
         # Настройка диспетчера
         storage = MemoryStorage()
         dp = Dispatcher(storage=storage)
@@ -74,6 +91,14 @@ async def main():
         except ImportError as e:
             logger.warning(f"⚠️ Роутер admin не найден: {e}")
         
+        # 🔥 МЕТРИКИ: задержка цикла событий и /metrics для Prometheus
+        from metrics import loop_lag_monitor, start_http_server
+        loop_lag_monitor.start()
+        
+        metrics_port = int(os.environ.get("METRICS_PORT", "0"))
+        if metrics_port:
+            metrics_runner = await start_http_server(metrics_port)
+        
         # 🔥 ЗАПУСКАЕМ ПОЛЛИНГ С ОБРАБОТКОЙ КОНФЛИКТОВ
         logger.info("🚀 Запускаю поллинг...")
         
@@ -93,6 +118,14 @@ async def main():
         logger.error(f"💥 Критическая ошибка: {e}")
     
     finally:
+        if 'metrics_runner' in locals():
+            await metrics_runner.cleanup()
+        if 'loop_lag_monitor' in locals():
+            await loop_lag_monitor.stop()
+        if 'db' in locals():
+            await db.close()
+        if 'shutdown_executors' in locals():
+            shutdown_executors()
         if 'bot' in locals():
             await bot.session.close()
         logger.info("👋 Завершение работы")
@@ -9,19 +9,21 @@ def check_db():
     
     print("📊 СТАТИСТИКА БАЗЫ:\n")
     
-    # Юзеры
-    cursor.execute("SELECT COUNT(*) FROM users")
-    users_count = cursor.fetchone()[0]
-    print(f"👥 Юзеров: {users_count}")
+    # 🔥 Итоги ведутся триггерами — не агрегируем всю историю
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'global_totals'")
+    if cursor.fetchone():
+        cursor.execute("SELECT users, downloads, tracks, size_mb FROM global_totals WHERE id = 1")
+        users_count, downloads_count, tracks, size = cursor.fetchone() or (0, 0, 0, 0.0)
+    else:
+        cursor.execute("SELECT COUNT(*) FROM users")
+        users_count = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM download_history")
+        downloads_count = cursor.fetchone()[0]
+        cursor.execute("SELECT SUM(tracks_count), SUM(file_size_mb) FROM statistics")
+        tracks, size = cursor.fetchone()
     
-    # Загрузки
-    cursor.execute("SELECT COUNT(*) FROM download_history")
-    downloads_count = cursor.fetchone()[0]
+    print(f"👥 Юзеров: {users_count}")
     print(f"📥 Загрузок: {downloads_count}")
-    
-    # Статистика
-    cursor.execute("SELECT SUM(tracks_count), SUM(file_size_mb) FROM statistics")
-    tracks, size = cursor.fetchone()
     print(f"🎵 Треков: {tracks or 0}")
     print(f"💾 Размер: {size or 0:.1f} MB")
     
@@ -62,6 +62,9 @@ if KOYEB:
     YOUTUBE_MAX_RETRIES = 5
     ENABLE_PROXY = True
     LOG_LEVEL = "INFO"
+    MAX_CONCURRENT_DOWNLOADS = 3
+    DOWNLOAD_WORKERS = 4
+    TRACK_STORE_MAX_MB = 1024
     print("🎯 Режим: KOYEB (оптимизированный)")
 
 elif RENDER:
@@ -72,6 +75,9 @@ elif RENDER:
     YOUTUBE_MAX_RETRIES = 3
     ENABLE_PROXY = False
     LOG_LEVEL = "INFO"
+    MAX_CONCURRENT_DOWNLOADS = 2
+    DOWNLOAD_WORKERS = 3
+    TRACK_STORE_MAX_MB = 512
     print("🎯 Режим: RENDER (сбалансированный)")
 
 elif HEROKU:
@@ -82,6 +88,9 @@ elif HEROKU:
     YOUTUBE_MAX_RETRIES = 2
     ENABLE_PROXY = False
     LOG_LEVEL = "INFO"
+    MAX_CONCURRENT_DOWNLOADS = 1
+    DOWNLOAD_WORKERS = 2
+    TRACK_STORE_MAX_MB = 256
     print("🎯 Режим: HEROKU (экономный)")
 
 elif PYTHONANYWHERE:
@@ -92,6 +101,9 @@ elif PYTHONANYWHERE:
     YOUTUBE_MAX_RETRIES = 3
     ENABLE_PROXY = True
     LOG_LEVEL = "INFO"
+    MAX_CONCURRENT_DOWNLOADS = 2
+    DOWNLOAD_WORKERS = 2
+    TRACK_STORE_MAX_MB = 512
     print("🎯 Режим: PYTHONANYWHERE (ограниченный)")
 
 else:
@@ -103,6 +115,9 @@ else:
     YOUTUBE_TIMEOUT = int(os.environ.get("YOUTUBE_TIMEOUT", "60"))
     ENABLE_PROXY = os.environ.get("ENABLE_PROXY", "false").lower() == "true"
     LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")
+    MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", "4"))
+    DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "6"))
+    TRACK_STORE_MAX_MB = int(os.environ.get("TRACK_STORE_MAX_MB", "2048"))
     print("🎯 Режим: LOCAL (полные возможности)")
 
 # 🔥 ДОПОЛНИТЕЛЬНЫЕ НАСТРОЙКИ
@@ -110,6 +125,17 @@ ADMIN_ID = int(os.environ.get("ADMIN_ID", "7021944306"))
 ENABLE_YOUTUBE_DEBUG = False
 SAVE_DOWNLOADED_FILES = False
 
+# 🔥 СЖАТИЕ АРХИВОВ: auto (по расширению), sample (по пробе), stored, deflated
+ARCHIVE_COMPRESSION = os.environ.get("ARCHIVE_COMPRESSION", "auto").lower()
+# 🔥 ПОРЯДОК В АРХИВЕ: true — части идут по порядку плейлиста, false — минимум частей
+ZIP_KEEP_ORDER = os.environ.get("ZIP_KEEP_ORDER", "false").lower() == "true"
+# 🔥 ПОТОКИ ДЛЯ АРХИВАЦИИ И РАБОТЫ С ФАЙЛАМИ (вне цикла событий)
+ARCHIVE_WORKERS = int(os.environ.get("ARCHIVE_WORKERS", "2"))
+# 🔥 ОТДЕЛЬНЫЕ ПУЛЫ ПОТОКОВ: долгие загрузки не занимают потоки поиска и превью
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", "4"))
+PREVIEW_WORKERS = int(os.environ.get("PREVIEW_WORKERS", "4"))
+DOWNLOAD_POOL_WORKERS = int(os.environ.get("DOWNLOAD_POOL_WORKERS", str(MAX_CONCURRENT_DOWNLOADS * DOWNLOAD_WORKERS)))
+
 # 🔥 ПРОКСИ СЕРВЕРА (используются только если ENABLE_PROXY = True)
 PROXY_LIST = [
     'http://45.155.68.129:8133',
@@ -164,6 +190,10 @@ def print_startup_info():
     print(f"💾 Макс. размер: {MAX_DOWNLOAD_SIZE_MB}MB")
     print(f"🔄 Попытки: {YOUTUBE_MAX_RETRIES}")
     print(f"⏱ Таймаут: {DOWNLOAD_TIMEOUT}сек")
+    print(f"👷 Слотов загрузки: {MAX_CONCURRENT_DOWNLOADS}")
+    print(f"🧵 Потоков на плейлист: {DOWNLOAD_WORKERS}")
+    print(f"🧵 Пулы потоков: поиск {SEARCH_WORKERS}, превью {PREVIEW_WORKERS}, загрузка {DOWNLOAD_POOL_WORKERS}, архивы {ARCHIVE_WORKERS}")
+    print(f"🗄 Кэш треков на диске: {TRACK_STORE_MAX_MB}MB")
     print(f"📊 Логи: {LOG_LEVEL}")
     print(f"🤖 Бот: ACTIVE ✅")
     print("=" * 50)
@@ -1,8 +1,104 @@
+import asyncio
 import logging
-from typing import List, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from config import MAX_CONCURRENT_DOWNLOADS
+from metrics import registry
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+singleflight_calls = registry.counter("bot_singleflight_calls_total", "Вызовы через single-flight")
+
+class LRUCache:
+    """Потокобезопасный словарь с ограничением размера и вытеснением LRU.
+    
+    Если задан ttl (секунды), записи старше него считаются отсутствующими.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data = OrderedDict()  # ключ -> (истекает в, значение)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SingleFlight:
+    """Склеивает одновременные вызовы с одинаковым ключом в один.
+    
+    Первый вызов запускает работу задачей, остальные ждут ту же задачу.
+    Отмена одного из ждущих не отменяет общую работу для других.
+    
+    size — объем работы (например, сколько результатов запрошено): вызов
+    присоединяется к идущему с тем же ключом, только если тот не меньше.
+    Больший вызов запускается сам и дальше обслуживает новых ждущих.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Tuple[Any, asyncio.Task]] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]], size: Any = None) -> Any:
+        call = self._calls.get(key)
+        if call is not None and (size is None or (call[0] is not None and call[0] >= size)):
+            singleflight_calls.inc(flight=self.name, result="coalesced")
+            task = call[1]
+        else:
+            singleflight_calls.inc(flight=self.name, result="leader")
+            task = asyncio.ensure_future(func())
+            self._calls[key] = (size, task)
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        call = self._calls.get(key)
+        if call is not None and call[1] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Помечаем исключение прочитанным, даже если все ждущие уже ушли
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
 class DatabaseManager:
     def __init__(self):
         self.db = None
@@ -14,49 +110,81 @@ class DatabaseManager:
         return self.db
 
 class QueueManager:
-    def __init__(self):
+    """Очередь загрузок с несколькими параллельными слотами.
+
+    Одновременно обрабатывается до max_workers пользователей, у каждого
+    пользователя не больше одной активной загрузки. Остальные ждут в FIFO.
+    """
+
+    def __init__(self, max_workers: int = 1):
         self.queue: List[int] = []
-        self.current_user: Optional[int] = None
-        self._processing = False
+        self.max_workers = max(1, max_workers)
+        self.active_users: Set[int] = set()
         self._user_data = {}
 
     async def add_to_queue(self, user_id: int) -> int:
         if user_id not in self.queue:
             self.queue.append(user_id)
         
-        position = self.queue.index(user_id) + 1
+        position = self.get_queue_position(user_id)
         logger.info(f"Юзер {user_id} в очереди. Позиция: {position}")
         return position
 
     def start_processing(self, user_id: int):
-        self.current_user = user_id
-        self._processing = True
+        self.active_users.add(user_id)
         if user_id in self.queue:
             self.queue.remove(user_id)
-        logger.info(f"Начата обработка для user_id={user_id}")
+        # Стартовал не из очереди (нажал еще раз при свободном слоте) — данные задания из очереди больше не нужны
+        self.remove_user_data(user_id)
+        logger.info(
+            f"Начата обработка для user_id={user_id} "
+            f"(слоты: {len(self.active_users)}/{self.max_workers})"
+        )
 
-    def finish_processing(self):
-        logger.info(f"Завершена обработка для user_id={self.current_user}")
-        self.current_user = None
-        self._processing = False
+    def finish_processing(self, user_id: int):
+        self.active_users.discard(user_id)
+        logger.info(
+            f"Завершена обработка для user_id={user_id} "
+            f"(слоты: {len(self.active_users)}/{self.max_workers})"
+        )
 
     def get_next_user(self) -> Optional[int]:
-        return self.queue[0] if self.queue else None
+        """Первый в очереди пользователь, у которого сейчас нет активной загрузки"""
+        for user_id in self.queue:
+            if user_id not in self.active_users:
+                return user_id
+        return None
 
     def is_user_in_queue(self, user_id: int) -> bool:
         return user_id in self.queue
 
     def get_queue_position(self, user_id: int) -> int:
-        try:
-            return self.queue.index(user_id) + 1
-        except ValueError:
+        """Позиция среди тех, кого get_next_user может выбрать: занятые загрузкой впереди не считаются"""
+        if user_id not in self.queue:
             return 0
+        
+        ahead = 0
+        for queued_id in self.queue:
+            if queued_id == user_id:
+                break
+            if queued_id not in self.active_users:
+                ahead += 1
+        return ahead + 1
 
     def get_queue_size(self) -> int:
         return len(self.queue)
 
     def is_processing(self) -> bool:
-        return self._processing
+        return bool(self.active_users)
+
+    def is_user_processing(self, user_id: int) -> bool:
+        return user_id in self.active_users
+
+    def has_free_slot(self) -> bool:
+        return len(self.active_users) < self.max_workers
+
+    def get_active_count(self) -> int:
+        return len(self.active_users)
 
     def set_user_data(self, user_id: int, data: dict):
         self._user_data[user_id] = data
@@ -69,4 +197,4 @@ class QueueManager:
             del self._user_data[user_id]
 
 db_manager = DatabaseManager()
-queue_manager = QueueManager()
\ No newline at end of file
+queue_manager = QueueManager(max_workers=MAX_CONCURRENT_DOWNLOADS)
\ No newline at end of file
@@ -1,8 +1,17 @@
 import os
+import asyncio
 import aiosqlite
 import json
+import time
+import zlib
+from contextlib import asynccontextmanager
+import logging
 from datetime import datetime
 
+from core import LRUCache
+from metrics import registry, db_query_seconds, instrument_methods
+from urls import canonicalize_url
+
 # 🔥 УМНАЯ БАЗА ДЛЯ RENDER И ЛОКАЛЬНОЙ РАЗРАБОТКИ
 if "RENDER" in os.environ:
     # На Render используем /tmp но с персистентностью
@@ -13,89 +22,659 @@ else:
 
 DB_PATH = os.path.join(DB_DIR, "bot.db")
 
+# 🔥 КЭШ TELEGRAM file_id ДЛЯ УЖЕ ЗАГРУЖЕННЫХ ТРЕКОВ
+TRACK_CACHE_TTL_DAYS = int(os.environ.get("TRACK_CACHE_TTL_DAYS", "30"))
+TRACK_CACHE_MAX_ROWS = int(os.environ.get("TRACK_CACHE_MAX_ROWS", "50000"))
+TRACK_CACHE_EVICT_EVERY = 100
+
+# 🔥 КЭШ ПЛЕЙЛИСТОВ: свежесть по TTL при чтении + фоновая чистка по бюджету строк и байт
+PLAYLIST_CACHE_TTL_HOURS = int(os.environ.get("PLAYLIST_CACHE_TTL_HOURS", "24"))
+PLAYLIST_CACHE_MAX_ROWS = int(os.environ.get("PLAYLIST_CACHE_MAX_ROWS", "5000"))
+PLAYLIST_CACHE_MAX_MB = int(os.environ.get("PLAYLIST_CACHE_MAX_MB", "64"))
+PLAYLIST_CACHE_SWEEP_MINUTES = float(os.environ.get("PLAYLIST_CACHE_SWEEP_MINUTES", "30"))
+
+# 🔥 КОМПАКТНЫЙ ФОРМАТ КЭША: префикс версии + zlib. Строки без префикса — старый JSON-текст
+CACHE_BLOB_JSON = b"Z1"    # zlib(компактный JSON)
+CACHE_BLOB_TITLES = b"T1"  # zlib(JSON-список названий) для [{'title': ...}, ...]
+CACHE_BLOB_LEVEL = 6
+
+# 🔥 ПУЛ СОЕДИНЕНИЙ: открывается один раз в init_db, закрывается в close()
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "16384"))
+
+# 🔥 ОТЛОЖЕННАЯ ЗАПИСЬ: история, статистика и юзеры пишутся пачками
+DB_FLUSH_INTERVAL = float(os.environ.get("DB_FLUSH_INTERVAL", "2"))
+DB_FLUSH_MAX_PENDING = int(os.environ.get("DB_FLUSH_MAX_PENDING", "200"))
+
+# 🔥 КЭШ ЯЗЫКОВ: язык читается почти в каждом хендлере
+LANGUAGE_CACHE_SIZE = int(os.environ.get("LANGUAGE_CACHE_SIZE", "10000"))
+
+logger = logging.getLogger(__name__)
+
+track_cache_lookups = registry.counter("bot_track_cache_lookups_total", "Поиск треков в кэше file_id")
+
+# 🔥 ИНДЕКСЫ ПОД ГОРЯЧИЕ ЗАПРОСЫ: фильтр по user_id (+ playlist_url), сортировка по created_at
+HISTORY_INDEXES = (
+    ('idx_download_history_user_created', 'download_history (user_id, created_at)'),
+    ('idx_download_history_user_url_created', 'download_history (user_id, playlist_url, created_at)'),
+    ('idx_statistics_user_created', 'statistics (user_id, created_at)'),
+)
+
+LAST_DOWNLOAD_SQL = '''
+    SELECT playlist_title, created_at FROM download_history 
+    WHERE user_id = ? AND playlist_url = ?
+    ORDER BY created_at DESC LIMIT 1
+'''
+
+USER_HISTORY_SQL = '''
+    SELECT playlist_url, playlist_title, tracks_count, file_size_mb, created_at
+    FROM download_history 
+    WHERE user_id = ?
+    ORDER BY created_at DESC 
+    LIMIT ?
+'''
+
+# 🔥 ИТОГИ СЧИТАЮТСЯ ТРИГГЕРАМИ ПРИ ВСТАВКЕ — /stats не агрегирует всю историю
+TOTALS_TRIGGERS = (
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_download_history_totals_insert
+    AFTER INSERT ON download_history
+    BEGIN
+        INSERT INTO user_totals (user_id, downloads, tracks, size_mb)
+        VALUES (NEW.user_id, 1, COALESCE(NEW.tracks_count, 0), COALESCE(NEW.file_size_mb, 0))
+        ON CONFLICT(user_id) DO UPDATE SET
+            downloads = downloads + 1,
+            tracks = tracks + excluded.tracks,
+            size_mb = size_mb + excluded.size_mb;
+        UPDATE global_totals SET
+            downloads = downloads + 1,
+            tracks = tracks + COALESCE(NEW.tracks_count, 0),
+            size_mb = size_mb + COALESCE(NEW.file_size_mb, 0)
+        WHERE id = 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_download_history_totals_delete
+    AFTER DELETE ON download_history
+    BEGIN
+        UPDATE user_totals SET
+            downloads = downloads - 1,
+            tracks = tracks - COALESCE(OLD.tracks_count, 0),
+            size_mb = size_mb - COALESCE(OLD.file_size_mb, 0)
+        WHERE user_id = OLD.user_id;
+        UPDATE global_totals SET
+            downloads = downloads - 1,
+            tracks = tracks - COALESCE(OLD.tracks_count, 0),
+            size_mb = size_mb - COALESCE(OLD.file_size_mb, 0)
+        WHERE id = 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_users_totals_insert
+    AFTER INSERT ON users
+    BEGIN
+        UPDATE global_totals SET users = users + 1 WHERE id = 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_users_totals_delete
+    AFTER DELETE ON users
+    BEGIN
+        UPDATE global_totals SET users = users - 1 WHERE id = 1;
+    END
+    ''',
+)
+
+# users пишется через UPSERT: INSERT OR REPLACE удаляет строку без DELETE-триггера и сбил бы счетчик
+UPSERT_USER_SQL = '''
+    INSERT INTO users (user_id, username, first_name, last_name, language)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = excluded.username,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        language = excluded.language
+'''
+
+# Запросы, планы которых проверяются после миграции: имя -> (SQL, пример параметров)
+HOT_QUERIES = {
+    'is_playlist_downloaded': (LAST_DOWNLOAD_SQL, (0, '')),
+    'get_download_history': (USER_HISTORY_SQL, (0, 5)),
+}
+
+language_cache_lookups = registry.counter("bot_language_cache_lookups_total", "Поиск языка юзера в кэше")
+playlist_cache_lookups = registry.counter("bot_playlist_cache_lookups_total", "Поиск плейлистов в кэше")
+playlist_cache_evicted = registry.counter("bot_playlist_cache_evicted_total", "Плейлисты, удаленные из кэша")
+flushed_rows = registry.counter("bot_db_flushed_rows_total", "Строки, записанные отложенной записью")
+flush_errors = registry.counter("bot_db_flush_errors_total", "Неудачные сбросы отложенной записи")
+
+def _utc_timestamp():
+    """Время в формате CURRENT_TIMESTAMP, чтобы отложенные строки сохраняли порядок"""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+def encode_cache_blob(value):
+    """Сжимает JSON-совместимое значение для playlist_cache"""
+    if isinstance(value, list) and all(isinstance(item, dict) and item.keys() == {'title'} for item in value):
+        tag, value = CACHE_BLOB_TITLES, [item['title'] for item in value]
+    else:
+        tag = CACHE_BLOB_JSON
+    data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+    return tag + zlib.compress(data, CACHE_BLOB_LEVEL)
+
+def decode_cache_blob(blob):
+    """Обратное к encode_cache_blob; старые строки с JSON-текстом читаются как раньше"""
+    if isinstance(blob, str):
+        return json.loads(blob)
+    
+    tag, data = bytes(blob[:2]), blob[2:]
+    value = json.loads(zlib.decompress(data))
+    if tag == CACHE_BLOB_TITLES:
+        return [{'title': title} for title in value]
+    if tag == CACHE_BLOB_JSON:
+        return value
+    raise ValueError(f"Неизвестный формат кэша: {tag!r}")
+
+class WriteBehindBuffer:
+    """Записи, которые еще не дошли до базы.
+    
+    Юзеры схлопываются по user_id (побеждает последний upsert), история и
+    статистика копятся списками в порядке добавления.
+    """
+    
+    def __init__(self):
+        self.users = {}
+        self.history = []
+        self.statistics = []
+    
+    def __len__(self):
+        return len(self.users) + len(self.history) + len(self.statistics)
+    
+    def drain(self):
+        users, history, statistics = self.users, self.history, self.statistics
+        self.users, self.history, self.statistics = {}, [], []
+        return users, history, statistics
+    
+    def restore(self, users, history, statistics):
+        """Возвращает в буфер записи, которые не удалось сбросить"""
+        for user_id, row in users.items():
+            self.users.setdefault(user_id, row)
+        self.history[:0] = history
+        self.statistics[:0] = statistics
+
+class ConnectionPool:
+    """Пул долгоживущих соединений aiosqlite.
+    
+    Каждое соединение держит свой поток и кэш подготовленных выражений,
+    поэтому запросы не платят за открытие базы и повторный разбор SQL.
+    """
+    
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = max(1, size)
+        self._idle = asyncio.Queue()
+        self._connections = []
+    
+    async def open(self):
+        for _ in range(self.size):
+            conn = aiosqlite.connect(self.path, cached_statements=256)
+            # Поток соединения не должен держать процесс, если close() не вызвали
+            conn.daemon = True
+            await conn
+            await self._configure(conn)
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+    
+    async def _configure(self, conn):
+        # WAL: читатели не ждут писателя; NORMAL в WAL безопасен и не делает fsync на каждый commit
+        await conn.execute("PRAGMA journal_mode = WAL")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        await conn.execute("PRAGMA temp_store = MEMORY")
+        await conn.execute("PRAGMA busy_timeout = 5000")
+        await conn.execute("PRAGMA foreign_keys = ON")
+    
+    @asynccontextmanager
+    async def acquire(self):
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                # Запрос упал посреди транзакции — не отдаем ее следующему
+                try:
+                    await conn.rollback()
+                except Exception:
+                    pass
+            self._idle.put_nowait(conn)
+    
+    async def close(self):
+        for conn in self._connections:
+            try:
+                await conn.close()
+            except Exception as e:
+                print(f"⚠️ Ошибка закрытия соединения с БД: {e}")
+        self._connections.clear()
+        self._idle = asyncio.Queue()
+
+async def _migration_base_schema(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            language TEXT DEFAULT 'ua',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS playlist_cache (
+            playlist_url TEXT PRIMARY KEY,
+            playlist_data TEXT NOT NULL,
+            tracks_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS download_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            playlist_url TEXT NOT NULL,
+            playlist_title TEXT NOT NULL,
+            tracks_count INTEGER NOT NULL,
+            file_size_mb REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS statistics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            action_type TEXT NOT NULL,
+            tracks_count INTEGER NOT NULL,
+            file_size_mb REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS track_cache (
+            track_id TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            title TEXT,
+            file_size INTEGER DEFAULT 0,
+            hits INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_track_cache_last_used
+        ON track_cache (last_used_at)
+    ''')
+
+async def _migration_history_indexes(db):
+    for name, target in HISTORY_INDEXES:
+        await db.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+
+async def _migration_totals(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS user_totals (
+            user_id INTEGER PRIMARY KEY,
+            downloads INTEGER NOT NULL DEFAULT 0,
+            tracks INTEGER NOT NULL DEFAULT 0,
+            size_mb REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS global_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            users INTEGER NOT NULL DEFAULT 0,
+            downloads INTEGER NOT NULL DEFAULT 0,
+            tracks INTEGER NOT NULL DEFAULT 0,
+            size_mb REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    for trigger in TOTALS_TRIGGERS:
+        await db.execute(trigger)
+    
+    cursor = await db.execute('SELECT 1 FROM global_totals WHERE id = 1')
+    if await cursor.fetchone():
+        return
+    
+    # Первый запуск с итогами: считаем их по уже накопленным данным (в той же транзакции)
+    await db.execute('''
+        INSERT INTO user_totals (user_id, downloads, tracks, size_mb)
+        SELECT user_id, COUNT(*), COALESCE(SUM(tracks_count), 0), COALESCE(SUM(file_size_mb), 0)
+        FROM download_history
+        GROUP BY user_id
+    ''')
+    await db.execute('''
+        INSERT INTO global_totals (id, users, downloads, tracks, size_mb)
+        SELECT 1,
+            (SELECT COUNT(*) FROM users),
+            COUNT(*), COALESCE(SUM(tracks_count), 0), COALESCE(SUM(file_size_mb), 0)
+        FROM download_history
+    ''')
+    print("✅ Итоговая статистика пересчитана по истории")
+
+async def _migration_playlist_cache_eviction(db):
+    cursor = await db.execute('PRAGMA table_info(playlist_cache)')
+    columns = {row[1] for row in await cursor.fetchall()}
+    
+    if 'last_accessed' not in columns:
+        await db.execute('ALTER TABLE playlist_cache ADD COLUMN last_accessed TIMESTAMP')
+    if 'size_bytes' not in columns:
+        await db.execute('ALTER TABLE playlist_cache ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0')
+    
+    await db.execute('''
+        UPDATE playlist_cache SET
+            last_accessed = COALESCE(last_accessed, created_at),
+            size_bytes = LENGTH(CAST(playlist_data AS BLOB)) + LENGTH(CAST(tracks_data AS BLOB))
+    ''')
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_playlist_cache_last_accessed
+        ON playlist_cache (last_accessed)
+    ''')
+
+async def _migration_canonical_urls(db):
+    cursor = await db.execute('SELECT DISTINCT playlist_url FROM download_history')
+    renames = [
+        (canonicalize_url(url), url) for (url,) in await cursor.fetchall()
+        if canonicalize_url(url) != url
+    ]
+    await db.executemany('UPDATE download_history SET playlist_url = ? WHERE playlist_url = ?', renames)
+    
+    # Кэш плейлистов одноразовый — неканонические ключи проще удалить, чем сливать
+    cursor = await db.execute('SELECT playlist_url FROM playlist_cache')
+    stale = [(url,) for (url,) in await cursor.fetchall() if canonicalize_url(url) != url]
+    await db.executemany('DELETE FROM playlist_cache WHERE playlist_url = ?', stale)
+
+async def _migration_playlist_tracks_chunks(db):
+    # Треки больших плейлистов пишутся кусками по мере извлечения; удаляются вместе с плейлистом
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS playlist_tracks_chunks (
+            playlist_url TEXT NOT NULL REFERENCES playlist_cache (playlist_url) ON DELETE CASCADE,
+            chunk_index INTEGER NOT NULL,
+            tracks_data BLOB NOT NULL,
+            PRIMARY KEY (playlist_url, chunk_index)
+        )
+    ''')
+
+async def _migration_track_cache_media_type(db):
+    # file_id от Audio нельзя переслать как Document — запоминаем, чем он был
+    cursor = await db.execute('PRAGMA table_info(track_cache)')
+    columns = {row[1] for row in await cursor.fetchall()}
+    
+    if 'media_type' not in columns:
+        await db.execute("ALTER TABLE track_cache ADD COLUMN media_type TEXT NOT NULL DEFAULT 'document'")
+
+# 🔥 МИГРАЦИИ: (версия, имя, шаг). Только дописывать в конец, уже выпущенные шаги не менять.
+# Каждый шаг идемпотентен — базы, созданные до schema_version, проходят их без ошибок.
+MIGRATIONS = (
+    (1, "base_schema", _migration_base_schema),
+    (2, "history_indexes", _migration_history_indexes),
+    (3, "totals", _migration_totals),
+    (4, "playlist_cache_eviction", _migration_playlist_cache_eviction),
+    (5, "canonical_urls", _migration_canonical_urls),
+    (6, "playlist_tracks_chunks", _migration_playlist_tracks_chunks),
+    (7, "track_cache_media_type", _migration_track_cache_media_type),
+)
+
 class Database:
     def __init__(self):
         os.makedirs(DB_DIR, exist_ok=True)
         print(f"📁 База данных: {DB_PATH}")
         print(f"🌍 Окружение: {'Render' if 'RENDER' in os.environ else 'Local'}")
+        self._track_cache_inserts = 0
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+        self._pending = WriteBehindBuffer()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._flusher = None
+        self._sweeper = None
+        self._languages = LRUCache(LANGUAGE_CACHE_SIZE)
+        # Растет при каждой записи языка: промах кэша не кладет в кэш прочитанное до записи
+        self._language_generation = 0
     
-    async def init_db(self):
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute("PRAGMA foreign_keys = ON")
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    language TEXT DEFAULT 'ua',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS playlist_cache (
-                    playlist_url TEXT PRIMARY KEY,
-                    playlist_data TEXT NOT NULL,
-                    tracks_data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+    async def open_pool(self):
+        async with self._pool_lock:
+            if self._pool is None:
+                pool = ConnectionPool(DB_PATH)
+                await pool.open()
+                self._pool = pool
+    
+    async def close(self):
+        """Сбрасывает отложенные записи и закрывает пул соединений (при остановке бота)"""
+        await self.stop_sweeper()
+        await self.stop_flusher()
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"❌ Не удалось сохранить отложенные записи: {e}")
+        
+        async with self._pool_lock:
+            if self._pool is not None:
+                await self._pool.close()
+                self._pool = None
+    
+    def start_flusher(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+        return self._flusher
+    
+    async def stop_flusher(self):
+        await self._cancel(self._flusher)
+        await self._cancel(self._flush_task)
+        self._flusher = None
+        self._flush_task = None
+    
+    def start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+        return self._sweeper
+    
+    async def stop_sweeper(self):
+        await self._cancel(self._sweeper)
+        self._sweeper = None
+    
+    async def _cancel(self, task):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(PLAYLIST_CACHE_SWEEP_MINUTES * 60)
+            try:
+                rows, size = await self.sweep_playlist_cache()
+                if rows:
+                    logger.info(f"Кэш плейлистов: удалено {rows} записей, {size / 1024:.0f}KB")
+            except Exception as e:
+                logger.error(f"Ошибка чистки кэша плейлистов: {e}")
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(DB_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка отложенной записи в БД: {e}")
+    
+    def _queued(self):
+        """Сбрасывает буфер в фоне, если он дорос до порога"""
+        if len(self._pending) >= DB_FLUSH_MAX_PENDING and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+    
+    async def flush(self):
+        """Пишет все отложенные записи одной транзакцией, возвращает число строк"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
             
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS download_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    playlist_url TEXT NOT NULL,
-                    playlist_title TEXT NOT NULL,
-                    tracks_count INTEGER NOT NULL,
-                    file_size_mb REAL NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            users, history, statistics = self._pending.drain()
+            try:
+                async with self._connection() as db:
+                    if users:
+                        await db.executemany(UPSERT_USER_SQL, list(users.values()))
+                    if history:
+                        await db.executemany('''
+                            INSERT INTO download_history (user_id, playlist_url, playlist_title, tracks_count, file_size_mb, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        ''', history)
+                    if statistics:
+                        await db.executemany('''
+                            INSERT INTO statistics (user_id, action_type, tracks_count, file_size_mb, created_at)
+                            VALUES (?, ?, ?, ?, ?)
+                        ''', statistics)
+                    await db.commit()
+            except Exception:
+                self._pending.restore(users, history, statistics)
+                flush_errors.inc()
+                raise
             
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS statistics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    action_type TEXT NOT NULL,
-                    tracks_count INTEGER NOT NULL,
-                    file_size_mb REAL NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            rows = len(users) + len(history) + len(statistics)
+            flushed_rows.inc(rows)
+            return rows
+    
+    @asynccontextmanager
+    async def _connection(self):
+        if self._pool is None:
+            await self.open_pool()
+        async with self._pool.acquire() as conn:
+            yield conn
+    
+    async def init_db(self):
+        await self.open_pool()
+        async with self._connection() as db:
+            await self._migrate(db)
+            await self._check_query_plans(db)
+            print(f"✅ База готова: {DB_PATH}")
+        
+        self.start_flusher()
+        self.start_sweeper()
+
+    async def _migrate(self, db):
+        """Применяет недостающие миграции, каждую в своей транзакции"""
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                duration_ms REAL NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await db.commit()
+        
+        for version, name, step in MIGRATIONS:
+            start = time.perf_counter()
+            # IMMEDIATE: второй процесс с той же базой подождет и увидит уже примененную версию
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = await db.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+                if await cursor.fetchone():
+                    await db.rollback()
+                    continue
+                
+                await step(db)
+                duration_ms = (time.perf_counter() - start) * 1000
+                await db.execute(
+                    'INSERT INTO schema_version (version, name, duration_ms) VALUES (?, ?, ?)',
+                    (version, name, duration_ms)
                 )
-            ''')
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                print(f"❌ Миграция {version} ({name}) не применена")
+                raise
             
-            await db.commit()
-            print(f"✅ База готова: {DB_PATH}")
+            print(f"🛠 Миграция {version} ({name}): {duration_ms:.0f}мс")
+
+    async def _check_query_plans(self, db):
+        await db.execute('PRAGMA optimize')
+        for query, plan in (await self._explain(db)).items():
+            if any(step.startswith('SCAN') for step in plan):
+                logger.warning(f"⚠️ Запрос {query} без индекса: {'; '.join(plan)}")
+
+    async def get_schema_version(self):
+        async with self._connection() as db:
+            cursor = await db.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+            return (await cursor.fetchone())[0]
+
+    async def _explain(self, db):
+        # EXPLAIN не сверяет версию схемы — читаем sqlite_master, чтобы соединение увидело новые индексы
+        await db.execute('SELECT COUNT(*) FROM sqlite_master')
+        plans = {}
+        for name, (sql, params) in HOT_QUERIES.items():
+            cursor = await db.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plans[name] = [row[3] for row in await cursor.fetchall()]
+        return plans
+
+    async def explain_query_plans(self):
+        """Планы SQLite для горячих запросов: {метод: [шаги плана]}"""
+        async with self._connection() as db:
+            return await self._explain(db)
 
     async def add_user(self, user_id, username, first_name, last_name, language='ua'):
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute('''
-                INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, language)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, username, first_name, last_name, language))
-            await db.commit()
+        self._pending.users[user_id] = (user_id, username, first_name, last_name, language)
+        self._language_generation += 1
+        self._languages.set(user_id, language)
+        self._queued()
 
     async def get_user_language(self, user_id):
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('SELECT language FROM users WHERE user_id = ?', (user_id,))
-            result = await cursor.fetchone()
-            return result[0] if result else 'ua'
+        language = self._languages.get(user_id)
+        if language is not None:
+            language_cache_lookups.inc(result="hit")
+            return language
+        language_cache_lookups.inc(result="miss")
+        generation = self._language_generation
+        
+        pending = self._pending.users.get(user_id)
+        if pending:
+            language = pending[4]
+        else:
+            async with self._connection() as db:
+                cursor = await db.execute('SELECT language FROM users WHERE user_id = ?', (user_id,))
+                result = await cursor.fetchone()
+                language = result[0] if result else 'ua'
+        
+        if generation == self._language_generation:
+            self._languages.set(user_id, language)
+        return language
 
     async def update_user_language(self, user_id, language):
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute('UPDATE users SET language = ? WHERE user_id = ?', (language, user_id))
+        # Юзер мог еще не доехать до базы — иначе UPDATE ничего не найдет
+        await self.flush()
+        async with self._connection() as db:
+            cursor = await db.execute('UPDATE users SET language = ? WHERE user_id = ?', (language, user_id))
             await db.commit()
+        
+        self._language_generation += 1
+        if cursor.rowcount > 0:
+            self._languages.set(user_id, language)
+        else:
+            # Юзера нет в базе — get_user_language вернет язык по умолчанию
+            self._languages.pop(user_id)
 
     async def is_playlist_downloaded(self, user_id, playlist_url):
         """🔥 ПРОВЕРЯЕМ СКАЧИВАЛ ЛИ ЮЗЕР ЭТОТ ПЛЕЙЛИСТ РАНЬШЕ"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('''
-                SELECT playlist_title, created_at FROM download_history 
-                WHERE user_id = ? AND playlist_url = ?
-                ORDER BY created_at DESC LIMIT 1
-            ''', (user_id, playlist_url))
+        playlist_url = canonicalize_url(playlist_url)
+        for row in reversed(self._pending.history):
+            if row[0] == user_id and row[1] == playlist_url:
+                return True, row[2], row[5]
+        
+        async with self._connection() as db:
+            cursor = await db.execute(LAST_DOWNLOAD_SQL, (user_id, playlist_url))
             result = await cursor.fetchone()
             
             if result:
@@ -103,66 +682,234 @@ class Database:
                 return True, title, date
             return False, None, None
 
-    async def get_cached_playlist(self, playlist_url):
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('''
-                SELECT playlist_data, tracks_data FROM playlist_cache 
+    async def get_cached_playlist(self, playlist_url, ttl_hours=PLAYLIST_CACHE_TTL_HOURS, with_tracks=True):
+        """Плейлист из кэша, если он моложе ttl_hours; просроченные записи не отдаются.
+        
+        with_tracks=False не читает и не распаковывает список треков (вместо него None).
+        """
+        playlist_url = canonicalize_url(playlist_url)
+        tracks_column = 'tracks_data' if with_tracks else 'NULL'
+        async with self._connection() as db:
+            cursor = await db.execute(f'''
+                SELECT playlist_data, {tracks_column}, created_at > datetime('now', ?) FROM playlist_cache 
                 WHERE playlist_url = ?
-            ''', (playlist_url,))
+            ''', (f'-{ttl_hours} hours', playlist_url))
             result = await cursor.fetchone()
             
-            if result:
-                playlist_data = json.loads(result[0])
-                tracks_data = json.loads(result[1])
-                return playlist_data, tracks_data
-            return None, None
+            if not result:
+                playlist_cache_lookups.inc(result="miss")
+                return None, None
+            
+            if not result[2]:
+                # Просрочено: удалит свипер или перезапишет cache_playlist
+                playlist_cache_lookups.inc(result="expired")
+                return None, None
+            
+            await db.execute(
+                'UPDATE playlist_cache SET last_accessed = CURRENT_TIMESTAMP WHERE playlist_url = ?',
+                (playlist_url,)
+            )
+            await db.commit()
+            
+            playlist_cache_lookups.inc(result="hit")
+            playlist_data = decode_cache_blob(result[0])
+            tracks_data = None
+            if with_tracks:
+                tracks_data = decode_cache_blob(result[1])
+                cursor = await db.execute('''
+                    SELECT tracks_data FROM playlist_tracks_chunks
+                    WHERE playlist_url = ? ORDER BY chunk_index
+                ''', (playlist_url,))
+                for (chunk,) in await cursor.fetchall():
+                    tracks_data.extend(decode_cache_blob(chunk))
+            return playlist_data, tracks_data
 
     async def cache_playlist(self, playlist_url, playlist_data, tracks_data):
-        async with aiosqlite.connect(DB_PATH) as db:
+        playlist_url = canonicalize_url(playlist_url)
+        playlist_blob = encode_cache_blob(playlist_data)
+        tracks_blob = encode_cache_blob(tracks_data)
+        size_bytes = len(playlist_blob) + len(tracks_blob)
+        
+        async with self._connection() as db:
+            await db.execute('''
+                INSERT OR REPLACE INTO playlist_cache (playlist_url, playlist_data, tracks_data, last_accessed, size_bytes)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)
+            ''', (playlist_url, playlist_blob, tracks_blob, size_bytes))
+            await db.commit()
+
+    async def append_playlist_tracks(self, playlist_url, chunk_index, tracks_data):
+        """Дописывает кусок треков к закэшированному плейлисту (chunk_index с 1, нулевой — в cache_playlist)"""
+        playlist_url = canonicalize_url(playlist_url)
+        blob = encode_cache_blob(tracks_data)
+        
+        async with self._connection() as db:
             await db.execute('''
-                INSERT OR REPLACE INTO playlist_cache (playlist_url, playlist_data, tracks_data)
+                INSERT OR REPLACE INTO playlist_tracks_chunks (playlist_url, chunk_index, tracks_data)
                 VALUES (?, ?, ?)
-            ''', (playlist_url, json.dumps(playlist_data), json.dumps(tracks_data)))
+            ''', (playlist_url, chunk_index, blob))
+            await db.execute(
+                'UPDATE playlist_cache SET size_bytes = size_bytes + ? WHERE playlist_url = ?',
+                (len(blob), playlist_url)
+            )
             await db.commit()
 
-    async def add_download_history(self, user_id, playlist_url, playlist_title, tracks_count, file_size_mb):
-        async with aiosqlite.connect(DB_PATH) as db:
+    async def update_cached_playlist(self, playlist_url, playlist_data):
+        """Обновляет только описание плейлиста, не трогая треки и куски"""
+        playlist_url = canonicalize_url(playlist_url)
+        blob = encode_cache_blob(playlist_data)
+        
+        async with self._connection() as db:
             await db.execute('''
-                INSERT INTO download_history (user_id, playlist_url, playlist_title, tracks_count, file_size_mb)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, playlist_url, playlist_title, tracks_count, file_size_mb))
+                UPDATE playlist_cache SET
+                    size_bytes = size_bytes - LENGTH(playlist_data) + ?,
+                    playlist_data = ?
+                WHERE playlist_url = ?
+            ''', (len(blob), blob, playlist_url))
             await db.commit()
 
-    async def add_statistics(self, user_id, action_type, tracks_count, file_size_mb):
-        async with aiosqlite.connect(DB_PATH) as db:
+    async def sweep_playlist_cache(self, max_rows=PLAYLIST_CACHE_MAX_ROWS,
+                                   max_bytes=PLAYLIST_CACHE_MAX_MB * 1024 * 1024,
+                                   ttl_hours=PLAYLIST_CACHE_TTL_HOURS):
+        """Удаляет просроченные плейлисты и давно не читанные сверх бюджета.
+        
+        Возвращает (удалено строк, освобождено байт).
+        """
+        async with self._connection() as db:
+            cursor = await db.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM playlist_cache')
+            rows_before, bytes_before = await cursor.fetchone()
+            
             await db.execute('''
-                INSERT INTO statistics (user_id, action_type, tracks_count, file_size_mb)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, action_type, tracks_count, file_size_mb))
+                DELETE FROM playlist_cache WHERE created_at <= datetime('now', ?)
+            ''', (f'-{ttl_hours} hours',))
+            
+            # Оставляем самые свежие по чтению, пока укладываемся и в строки, и в байты
+            await db.execute('''
+                DELETE FROM playlist_cache WHERE playlist_url IN (
+                    SELECT playlist_url FROM (
+                        SELECT playlist_url,
+                            ROW_NUMBER() OVER recent AS position,
+                            SUM(size_bytes) OVER recent AS running_bytes
+                        FROM playlist_cache
+                        WINDOW recent AS (ORDER BY last_accessed DESC, rowid DESC)
+                    )
+                    WHERE position > ? OR running_bytes > ?
+                )
+            ''', (max_rows, max_bytes))
+            
+            cursor = await db.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM playlist_cache')
+            rows_after, bytes_after = await cursor.fetchone()
             await db.commit()
+        
+        rows = rows_before - rows_after
+        playlist_cache_evicted.inc(rows)
+        return rows, bytes_before - bytes_after
 
-    async def get_user_statistics(self, user_id):
-        async with aiosqlite.connect(DB_PATH) as db:
+    async def get_playlist_cache_stats(self):
+        async with self._connection() as db:
+            cursor = await db.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM playlist_cache')
+            return await cursor.fetchone()
+
+    async def get_track_file_ids(self, track_ids):
+        """🔥 TELEGRAM file_id ДЛЯ УЖЕ ОТПРАВЛЕННЫХ ТРЕКОВ: {track_id: (file_id, file_size, media_type)}"""
+        track_ids = [track_id for track_id in dict.fromkeys(track_ids) if track_id]
+        if not track_ids:
+            return {}
+        
+        found = {}
+        async with self._connection() as db:
+            for start in range(0, len(track_ids), 500):
+                chunk = track_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = await db.execute(f'''
+                    SELECT track_id, file_id, file_size, media_type FROM track_cache
+                    WHERE track_id IN ({placeholders})
+                    AND created_at > datetime('now', ?)
+                ''', (*chunk, f'-{TRACK_CACHE_TTL_DAYS} days'))
+                for track_id, file_id, file_size, media_type in await cursor.fetchall():
+                    found[track_id] = (file_id, file_size or 0, media_type)
+            
+            if found:
+                placeholders = ','.join('?' * len(found))
+                await db.execute(f'''
+                    UPDATE track_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP
+                    WHERE track_id IN ({placeholders})
+                ''', tuple(found))
+                await db.commit()
+        
+        track_cache_lookups.inc(len(found), result="hit")
+        track_cache_lookups.inc(len(track_ids) - len(found), result="miss")
+        return found
+
+    async def cache_track_file_id(self, track_id, file_id, title=None, file_size=0, media_type='document'):
+        async with self._connection() as db:
+            await db.execute('''
+                INSERT OR REPLACE INTO track_cache (track_id, file_id, title, file_size, media_type)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (track_id, file_id, title, file_size, media_type))
+            await db.commit()
+        
+        self._track_cache_inserts += 1
+        if self._track_cache_inserts % TRACK_CACHE_EVICT_EVERY == 0:
+            await self.evict_track_cache()
+
+    async def delete_track_file_id(self, track_id):
+        async with self._connection() as db:
+            await db.execute('DELETE FROM track_cache WHERE track_id = ?', (track_id,))
+            await db.commit()
+
+    async def evict_track_cache(self, max_rows=TRACK_CACHE_MAX_ROWS, ttl_days=TRACK_CACHE_TTL_DAYS):
+        """Удаляет просроченные записи и самые давно использованные сверх лимита"""
+        async with self._connection() as db:
+            cursor = await db.execute('''
+                DELETE FROM track_cache WHERE created_at <= datetime('now', ?)
+            ''', (f'-{ttl_days} days',))
+            expired = cursor.rowcount
+            
             cursor = await db.execute('''
-                SELECT 
-                    COUNT(*) as total_downloads,
-                    SUM(tracks_count) as total_tracks,
-                    SUM(file_size_mb) as total_size
-                FROM download_history 
-                WHERE user_id = ?
-            ''', (user_id,))
+                DELETE FROM track_cache WHERE track_id IN (
+                    SELECT track_id FROM track_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (max_rows,))
+            overflow = cursor.rowcount
+            
+            await db.commit()
+            return expired + overflow
+
+    async def get_track_cache_stats(self):
+        async with self._connection() as db:
+            cursor = await db.execute('SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM track_cache')
+            rows, total_hits = await cursor.fetchone()
+        
+        hits = track_cache_lookups.get(result="hit")
+        lookups = hits + track_cache_lookups.get(result="miss")
+        hit_rate = hits / lookups if lookups else 0.0
+        return rows, total_hits, hit_rate
+
+    async def add_download_history(self, user_id, playlist_url, playlist_title, tracks_count, file_size_mb):
+        self._pending.history.append(
+            (user_id, canonicalize_url(playlist_url), playlist_title, tracks_count, file_size_mb, _utc_timestamp())
+        )
+        self._queued()
+
+    async def add_statistics(self, user_id, action_type, tracks_count, file_size_mb):
+        self._pending.statistics.append((user_id, action_type, tracks_count, file_size_mb, _utc_timestamp()))
+        self._queued()
+
+    async def get_user_statistics(self, user_id):
+        await self.flush()
+        async with self._connection() as db:
+            cursor = await db.execute(
+                'SELECT downloads, tracks, size_mb FROM user_totals WHERE user_id = ?', (user_id,)
+            )
             result = await cursor.fetchone()
             return result if result else (0, 0, 0.0)
 
     async def get_download_history(self, user_id, limit=5):
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('''
-                SELECT playlist_url, playlist_title, tracks_count, file_size_mb, created_at
-                FROM download_history 
-                WHERE user_id = ?
-                ORDER BY created_at DESC 
-                LIMIT ?
-            ''', (user_id, limit))
+        await self.flush()
+        async with self._connection() as db:
+            cursor = await db.execute(USER_HISTORY_SQL, (user_id, limit))
             results = await cursor.fetchall()
             
             history = []
@@ -178,29 +925,19 @@ class Database:
             return history
 
     async def get_global_statistics(self):
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('SELECT COUNT(*) FROM users')
-            total_users = (await cursor.fetchone())[0]
-            
-            cursor = await db.execute('''
-                SELECT 
-                    COUNT(*) as total_downloads,
-                    SUM(tracks_count) as total_tracks,
-                    SUM(file_size_mb) as total_size
-                FROM download_history
-            ''')
+        await self.flush()
+        async with self._connection() as db:
+            cursor = await db.execute('SELECT users, downloads, tracks, size_mb FROM global_totals WHERE id = 1')
             result = await cursor.fetchone()
-            
-            total_downloads = result[0] or 0
-            total_tracks = result[1] or 0
-            total_size = result[2] or 0.0
-            
-            return (total_users, total_downloads, total_tracks, total_size)
+            return tuple(result) if result else (0, 0, 0, 0.0)
 
     async def get_all_users(self):
-        async with aiosqlite.connect(DB_PATH) as db:
+        await self.flush()
+        async with self._connection() as db:
             cursor = await db.execute('SELECT user_id FROM users')
             results = await cursor.fetchall()
             return [row[0] for row in results]
 
+instrument_methods(Database, db_query_seconds)
+
 db = Database()
\ No newline at end of file
@@ -2,8 +2,11 @@ from aiogram import Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from core import db_manager
-from utils import send_message_to_user, get_user_language_safe
+from utils import send_message_to_user, get_user_language_safe, send_chunked_message
+from metrics import registry
+from services.executors import EXECUTORS
 import os
+import html
 import asyncio
 
 router = Router()
@@ -131,19 +134,55 @@ async def full_stats_handler(message: Message):
             stats_text += f"• Треков: {avg_tracks:.1f}\n"
             stats_text += f"• Размер: {avg_size:.1f} MB\n"
         
+        cache_rows, cache_hits, cache_hit_rate = await db.get_track_cache_stats()
+        stats_text += f"\n📦 **Кэш треков:** {cache_rows} (повторов: {cache_hits}, hit rate: {cache_hit_rate:.0%})\n"
+        
+        stats_text += "\n🧵 **Пулы потоков (занято/всего, в очереди):**\n"
+        for executor in EXECUTORS:
+            pool_stats = executor.get_stats()
+            stats_text += f"• {executor.name}: {pool_stats['active']}/{pool_stats['max_workers']}, {pool_stats['queued']}\n"
+        
         await message.answer(stats_text, parse_mode="Markdown")
         
     except Exception as e:
         print(f"Ошибка получения статистики: {e}")
         await message.answer(f"❌ Ошибка: {e}")
 
+@router.message(Command("metrics"))
+async def metrics_handler(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ Не админ")
+        return
+    
+    await send_chunked_message(message.bot, message.from_user.id, html.escape(registry.render()))
+
 @router.message(Command("cleanup"))
 async def cleanup_handler(message: Message):
     if not is_admin(message.from_user.id):
         await message.answer("❌ Не админ")
         return
         
-    await message.answer("🧹 Очистка кэша... (в разработке)")
+    db = db_manager.get_db()
+    if not db:
+        await message.answer("❌ База данных недоступна")
+        return
+    
+    try:
+        playlist_rows, playlist_bytes = await db.sweep_playlist_cache()
+        track_rows = await db.evict_track_cache()
+        cache_rows, cache_bytes = await db.get_playlist_cache_stats()
+        
+        cleanup_text = "🧹 **Очистка кэша завершена**\n\n"
+        cleanup_text += f"📋 **Плейлисты:** удалено {playlist_rows}, освобождено {playlist_bytes / 1024:.1f} KB\n"
+        # Без "_" в тексте: в Markdown одиночное подчеркивание ломает разбор сообщения
+        cleanup_text += f"🎵 **Кэш треков:** удалено {track_rows}\n"
+        cleanup_text += f"📦 **Осталось в кэше плейлистов:** {cache_rows} ({cache_bytes / 1024:.1f} KB)\n"
+        
+        await message.answer(cleanup_text, parse_mode="Markdown")
+        
+    except Exception as e:
+        print(f"Ошибка очистки кэша: {e}")
+        await message.answer(f"❌ Ошибка: {e}")
 
 def get_announcement_header(lang: str) -> str:
     headers = {
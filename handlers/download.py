@@ -4,13 +4,15 @@ import asyncio
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, FSInputFile  # ← Убедись что это есть
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramBadRequest
 
 from services import downloader, file_processor, playlist_preview
 from keyboards.main import get_download_keyboard
 from keyboards.confirm import get_confirm_keyboard
-from utils import send_message_to_user, send_document_to_user, send_ad_message, is_valid_url, safe_db_operation
+from utils import send_message_to_user, send_document_to_user, send_cached_file_to_user, send_ad_message, is_valid_url, safe_db_operation
 from lang_bot.translations import get_text
 from core import db_manager, queue_manager
+from urls import resolve_url
 
 router = Router()
 
@@ -25,6 +27,9 @@ async def playlist_handler(message: Message, state: FSMContext):
     if not is_valid_url(url):
         return
     
+    # 🔥 Один ключ для ?si=..., m.soundcloud.com и коротких on.soundcloud.com
+    url = await resolve_url(url)
+    
     lang = await safe_db_operation(
         lambda db: db.get_user_language(user_id),
         fallback='ua'
@@ -75,7 +80,9 @@ async def playlist_handler(message: Message, state: FSMContext):
     )
 
     if content_type == 'playlist':
-        preview_text += f"📊 <b>{get_text(lang, 'track_count')}:</b> {track_count}\n"
+        # Для огромных лайков точное число известно только после фонового извлечения
+        track_count_text = f"{track_count}+" if content_info.get('track_count_partial') else track_count
+        preview_text += f"📊 <b>{get_text(lang, 'track_count')}:</b> {track_count_text}\n"
 
     preview_text += f"\n{get_text(lang, 'choose_format')}"
 
@@ -164,7 +171,7 @@ async def callback_download(callback: CallbackQuery, state: FSMContext):
     
     await callback.answer()
     
-    if queue_manager.is_processing():
+    if not queue_manager.has_free_slot() or queue_manager.is_user_processing(user_id):
         position = await queue_manager.add_to_queue(user_id)
         
         queue_manager.set_user_data(user_id, {
@@ -183,41 +190,170 @@ async def callback_download(callback: CallbackQuery, state: FSMContext):
         queue_manager.start_processing(user_id)
         await start_download(callback.bot, user_id, callback.data, user_data)
 
-async def send_zip_parts(bot, user_id, tmpdir, content_title, lang):
+async def send_zip_parts(bot, user_id, tmpdir, content_title, lang, files=None):
+    zip_dir = tempfile.mkdtemp(prefix="zip_")
+    sent_parts = 0
+    
     try:
-        zip_base_path = os.path.join(tempfile.gettempdir(), f"{content_title}")
+        zip_base_path = os.path.join(zip_dir, f"{content_title}")
         
-        zip_parts = file_processor.create_zip_parts(tmpdir, zip_base_path, ZIP_PART_SIZE_MB * 1024 * 1024)
+        # Части отправляются по мере готовности, следующая собирается во время отправки
+        parts = file_processor.iter_zip_parts(tmpdir, zip_base_path, ZIP_PART_SIZE_MB * 1024 * 1024, files=files)
+        async for part_path, i, total_parts in parts:
+            if i == 1:
+                await send_message_to_user(bot, user_id, get_text(lang, "sending_archive").format(parts=total_parts))
+            
+            try:
+                await send_document_to_user(
+                    bot, user_id,
+                    FSInputFile(part_path),
+                    caption=get_text(lang, "part_sent").format(title=content_title, current=i, total=total_parts)
+                )
+                sent_parts += 1
+            except Exception as e:
+                await send_message_to_user(bot, user_id, get_text(lang, "part_send_error").format(part=i, error=str(e)))
+            finally:
+                await file_processor.cleanup_zip_parts_async([part_path])
         
-        if not zip_parts:
+        if not sent_parts:
             await send_message_to_user(bot, user_id, f"❌ {get_text(lang, 'archive_creation_failed')}")
             return False
         
-        total_parts = len(zip_parts)
-        await send_message_to_user(bot, user_id, get_text(lang, "sending_archive").format(parts=total_parts))
-        
-        for i, part_path in enumerate(zip_parts, 1):
-            if os.path.exists(part_path):
-                try:
-                    await send_document_to_user(
-                        bot, user_id,
-                        FSInputFile(part_path),
-                        caption=get_text(lang, "part_sent").format(title=content_title, current=i, total=total_parts)
-                    )
-                except Exception as e:
-                    await send_message_to_user(bot, user_id, get_text(lang, "part_send_error").format(part=i, error=str(e)))
-            else:
-                await send_message_to_user(bot, user_id, get_text(lang, "part_not_found").format(part=i, path=part_path))
-        
-        await send_message_to_user(bot, user_id, get_text(lang, "archive_sent").format(parts=total_parts))
-        
-        file_processor.cleanup_zip_parts(zip_parts)
+        await send_message_to_user(bot, user_id, get_text(lang, "archive_sent").format(parts=sent_parts))
         
         return True
         
     except Exception as e:
         await send_message_to_user(bot, user_id, get_text(lang, "zip_process_error").format(error=str(e)))
         return False
+    finally:
+        await file_processor.remove_tree_async(zip_dir)
+
+async def download_and_send_tracks(bot, user_id, url, tmpdir, content_title, lang, total_tracks=0):
+    """Скачивает и сразу отправляет треки: загрузка и отправка идут параллельно.
+    
+    Треки, которые бот уже отправлял, уходят по сохраненному Telegram file_id
+    без скачивания. Остальные отправляются в порядке плейлиста по мере загрузки,
+    отправленный файл сразу удаляется. Возвращает (кол-во треков, размер в MB).
+    """
+    track_queue = asyncio.Queue()
+    
+    async def produce():
+        try:
+            entries = await downloader.extract_entries(url)
+            if not entries:
+                await downloader.download_playlist(
+                    url, tmpdir,
+                    user_id=user_id,
+                    bot=bot,
+                    lang=lang,
+                    total_tracks=total_tracks,
+                    parallel=False,
+                    track_queue=track_queue
+                )
+                return
+            
+            cached = await safe_db_operation(
+                lambda db: db.get_track_file_ids([entry['track_id'] for entry in entries]),
+                fallback={}
+            ) or {}
+            
+            to_download = []
+            for entry in entries:
+                if entry['track_id'] in cached:
+                    entry['file_id'], entry['file_size'], entry['media_type'] = cached[entry['track_id']]
+                    await track_queue.put((entry, None))
+                else:
+                    to_download.append(entry)
+            
+            if to_download:
+                await downloader.download_playlist(
+                    url, tmpdir,
+                    user_id=user_id,
+                    bot=bot,
+                    lang=lang,
+                    total_tracks=total_tracks,
+                    track_queue=track_queue,
+                    entries=to_download
+                )
+        except Exception as e:
+            print(f"Ошибка загрузки треков для user {user_id}: {e}")
+        finally:
+            await track_queue.put(None)
+    
+    producer = asyncio.create_task(produce())
+    
+    total_label = total_tracks or "?"
+    await send_message_to_user(bot, user_id, f"📤 {get_text(lang, 'sending_tracks')} {total_label}...")
+    
+    sent = 0
+    total_bytes = 0
+    pending = {}
+    next_index = 0
+    
+    async def send_track(entry, file_path):
+        nonlocal sent, total_bytes
+        caption = f"🎵 {content_title} - {get_text(lang, 'track')} {sent + 1}/{total_label}"
+        
+        if entry.get('file_id'):
+            try:
+                if await send_cached_file_to_user(bot, user_id, entry['file_id'], entry.get('media_type'), caption=caption, lang=lang):
+                    sent += 1
+                    total_bytes += entry.get('file_size', 0)
+                # Блокировка бота, сеть, флуд-лимит — file_id тут ни при чем
+                return
+            except TelegramBadRequest as e:
+                print(f"Сохраненный file_id отклонен для {entry['track_id']}: {e}")
+            
+            # file_id больше не работает — убираем из кэша и качаем трек заново
+            await safe_db_operation(lambda db: db.delete_track_file_id(entry['track_id']))
+            file_path = await downloader.download_track(entry, tmpdir)
+        
+        if not file_path or not os.path.exists(file_path):
+            return
+        
+        file_size = os.path.getsize(file_path)
+        message = await send_document_to_user(bot, user_id, FSInputFile(file_path), caption=caption, lang=lang)
+        if message:
+            sent += 1
+            total_bytes += file_size
+        
+        document = (message.audio or message.document) if message else None
+        if document and entry.get('track_id'):
+            media_type = "audio" if message.audio else "document"
+            await safe_db_operation(
+                lambda db: db.cache_track_file_id(entry['track_id'], document.file_id, entry.get('title'), file_size, media_type)
+            )
+        
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+    
+    try:
+        while True:
+            item = await track_queue.get()
+            if item is None:
+                break
+            
+            entry, file_path = item
+            pending[entry['index']] = (entry, file_path)
+            
+            while next_index in pending:
+                await send_track(*pending.pop(next_index))
+                next_index += 1
+        
+        for index in sorted(pending):
+            await send_track(*pending[index])
+    finally:
+        if not producer.done():
+            producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+    
+    return sent, total_bytes / (1024 * 1024)
 
 async def start_download(bot, user_id, download_type, user_info):
     lang = await safe_db_operation(
@@ -235,50 +371,50 @@ async def start_download(bot, user_id, download_type, user_info):
             f"⏰ {get_text(lang, 'processing')}"
         )
         
-        with tempfile.TemporaryDirectory() as tmpdir:
-            success = await downloader.download_playlist(
-                url, tmpdir, 
-                user_id=user_id, 
-                bot=bot, 
-                lang=lang,
-                total_tracks=user_info.get('track_count', 0)
-            )
-            
-            if not success:
-                await send_message_to_user(bot, user_id, f"❌ {get_text(lang, 'download_failed')}")
-                return
-            
-            files = file_processor.get_files_in_directory(tmpdir)
-            if not files:
-                await send_message_to_user(bot, user_id, get_text(lang, "download_failed"))
-                return
-            
+        async with file_processor.temp_dir() as tmpdir:
             if download_type == "download_tracks":
-                total_tracks = len(files)
-                await send_message_to_user(bot, user_id, f"📤 {get_text(lang, 'sending_tracks')} {total_tracks}...")
+                files_count, total_size_mb = await download_and_send_tracks(
+                    bot, user_id, url, tmpdir, content_title, lang,
+                    total_tracks=user_info.get('track_count', 0)
+                )
                 
-                for idx, file_name in enumerate(files, 1):
-                    file_path = os.path.join(tmpdir, file_name)
-                    if os.path.exists(file_path):
-                        await send_document_to_user(
-                            bot, user_id,
-                            FSInputFile(file_path), 
-                            caption=f"🎵 {content_title} - {get_text(lang, 'track')} {idx}/{total_tracks}"
-                        )
+                if not files_count:
+                    await send_message_to_user(bot, user_id, f"❌ {get_text(lang, 'download_failed')}")
+                    return
                 
                 await send_message_to_user(bot, user_id, get_text(lang, "all_tracks_sent"))
             
-            elif download_type == "download_zip":
-                await send_zip_parts(bot, user_id, tmpdir, content_title, lang)
-            
-            total_size_mb = sum(os.path.getsize(os.path.join(tmpdir, f)) / (1024 * 1024) for f in files if os.path.exists(os.path.join(tmpdir, f)))
+            else:
+                downloaded = await downloader.download_playlist(
+                    url, tmpdir, 
+                    user_id=user_id, 
+                    bot=bot, 
+                    lang=lang,
+                    total_tracks=user_info.get('track_count', 0)
+                )
+                
+                if not downloaded:
+                    await send_message_to_user(bot, user_id, f"❌ {get_text(lang, 'download_failed')}")
+                    return
+                
+                files = await file_processor.get_files_in_directory_async(tmpdir)
+                if not files:
+                    await send_message_to_user(bot, user_id, get_text(lang, "download_failed"))
+                    return
+                
+                if download_type == "download_zip":
+                    await send_zip_parts(bot, user_id, tmpdir, content_title, lang, files=downloaded)
+                
+                files_count = len(files)
+                total_size = await file_processor.get_total_size_async(os.path.join(tmpdir, f) for f in files)
+                total_size_mb = total_size / (1024 * 1024)
             
             if not user_info.get('is_redownload'):
                 await safe_db_operation(
-                    lambda db: db.add_download_history(user_id, url, content_title, len(files), total_size_mb)
+                    lambda db: db.add_download_history(user_id, url, content_title, files_count, total_size_mb)
                 )
                 await safe_db_operation(
-                    lambda db: db.add_statistics(user_id, "download", len(files), total_size_mb)
+                    lambda db: db.add_statistics(user_id, "download", files_count, total_size_mb)
                 )
             
             await send_ad_message(bot, user_id, lang)
@@ -288,42 +424,49 @@ async def start_download(bot, user_id, download_type, user_info):
         await send_message_to_user(bot, user_id, f"❌ {get_text(lang, 'error')}: {str(e)}")
     
     finally:
-        queue_manager.finish_processing()
+        queue_manager.finish_processing(user_id)
         await process_next_in_queue(bot)
 
+# Ссылки на запущенные из очереди задачи, чтобы их не собрал GC
+_queue_tasks = set()
+
 async def process_next_in_queue(bot):
-    if queue_manager.is_processing():
-        return
+    """Занимает все свободные слоты пользователями из очереди (FIFO)"""
+    while queue_manager.has_free_slot():
+        next_user = queue_manager.get_next_user()
+        if not next_user:
+            return
         
-    next_user = queue_manager.get_next_user()
-    if not next_user:
-        return
+        user_data = queue_manager.get_user_data(next_user)
+        queue_manager.remove_user_data(next_user)
         
-    user_data = queue_manager.get_user_data(next_user)
-    if not user_data:
-        print(f"Нет данных для user_id={next_user} в очереди")
-        return
+        if not user_data:
+            print(f"Нет данных для user_id={next_user} в очереди")
+            if next_user in queue_manager.queue:
+                queue_manager.queue.remove(next_user)
+            continue
         
-    print(f"Запускаем скачивание для user_id={next_user} из очереди")
-    
+        print(f"Запускаем скачивание для user_id={next_user} из очереди")
+        
+        queue_manager.start_processing(next_user)
+        task = asyncio.create_task(run_queued_download(bot, next_user, user_data))
+        _queue_tasks.add(task)
+        task.add_done_callback(_queue_tasks.discard)
+
+async def run_queued_download(bot, user_id, user_data):
     try:
         lang = user_data.get('lang', 'ua')
         await send_message_to_user(
-            bot, next_user,
+            bot, user_id,
             f"🎉 {get_text(lang, 'congrats_first')}\n"
             f"⬇️ {get_text(lang, 'start_downloading')}"
         )
-        
-        queue_manager.start_processing(next_user)
-        await start_download(
-            bot,
-            next_user,
-            user_data['download_type'],
-            user_data['user_data']
-        )
-        
     except Exception as e:
-        print(f"Ошибка обработки user_id={next_user} из очереди: {e}")
-        queue_manager.finish_processing()
-    finally:
-        queue_manager.remove_user_data(next_user)
\ No newline at end of file
+        print(f"Ошибка уведомления user_id={user_id} из очереди: {e}")
+    
+    await start_download(
+        bot,
+        user_id,
+        user_data['download_type'],
+        user_data['user_data']
+    )
\ No newline at end of file
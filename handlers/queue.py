@@ -15,32 +15,28 @@ async def queue_handler(message: Message):
     try:
         lang = await get_user_language_safe(user_id)
         
-        if queue_manager.is_processing():
-            queue_size = queue_manager.get_queue_size()
-            
-            if queue_manager.is_user_in_queue(user_id):
-                position = queue_manager.get_queue_position(user_id)
-                await message.answer(
-                    f"⏳ {get_text(lang, 'you_in_queue')}\n"
-                    f"📊 {get_text(lang, 'queue_position')}: {position}\n"
-                    f"👥 {get_text(lang, 'total_in_queue')}: {queue_size}\n\n"
-                    f"💬 {get_text(lang, 'will_notify_start')}"
-                )
-            else:
-                await message.answer(
-                    f"🔄 {get_text(lang, 'processing_now')}\n"
-                    f"❌ {get_text(lang, 'not_in_queue')}"
-                )
+        queue_size = queue_manager.get_queue_size()
+        
+        if queue_manager.is_user_in_queue(user_id):
+            position = queue_manager.get_queue_position(user_id)
+            await message.answer(
+                f"⏳ {get_text(lang, 'you_in_queue')}\n"
+                f"📊 {get_text(lang, 'queue_position')}: {position}\n"
+                f"👥 {get_text(lang, 'total_in_queue')}: {queue_size}\n\n"
+                f"💬 {get_text(lang, 'will_notify_start')}"
+            )
+        elif queue_manager.is_user_processing(user_id):
+            await message.answer(
+                f"🔄 {get_text(lang, 'processing_now')}\n"
+                f"❌ {get_text(lang, 'not_in_queue')}"
+            )
+        elif queue_size:
+            await message.answer(
+                f"❌ {get_text(lang, 'not_in_queue')}\n"
+                f"👥 {get_text(lang, 'total_in_queue')}: {queue_size}"
+            )
         else:
-            if queue_manager.is_user_in_queue(user_id):
-                position = queue_manager.get_queue_position(user_id)
-                await message.answer(
-                    f"⏳ {get_text(lang, 'you_in_queue')}\n"
-                    f"📊 {get_text(lang, 'queue_position')}: {position}\n\n"
-                    f"🎉 {get_text(lang, 'congrats_first')}"
-                )
-            else:
-                await message.answer(get_text(lang, "queue_empty"))
+            await message.answer(get_text(lang, "queue_empty"))
             
     except Exception as e:
         print(f"Ошибка в queue_handler: {e}")
@@ -131,7 +127,7 @@ async def status_handler(message: Message):
         lang = await get_user_language_safe(user_id)
         
         queue_size = queue_manager.get_queue_size()
-        is_processing = queue_manager.is_processing()
+        active_count = queue_manager.get_active_count()
         
         db = db_manager.get_db()
         db_status = "✅" if db else "❌"
@@ -139,7 +135,7 @@ async def status_handler(message: Message):
         status_text = (
             f"🤖 {get_text(lang, 'status_title')}:\n"
             f"📊 {get_text(lang, 'queue_status')}: {queue_size}\n"
-            f"🔄 {get_text(lang, 'processing_status')}: {'✅' if is_processing else '❌'}\n"
+            f"🔄 {get_text(lang, 'processing_status')}: {active_count}/{queue_manager.max_workers}\n"
             f"🗄️ {get_text(lang, 'database_status')}: {db_status}"
         )
         
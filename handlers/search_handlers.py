@@ -4,7 +4,7 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from services.search import search_engine
+from services.search import search_engine, SEARCH_PAGE_SIZE
 from keyboards.main import get_search_keyboard, get_track_selection_keyboard, get_download_keyboard
 from lang_bot.translations import get_text
 from utils import get_user_language_safe
@@ -54,7 +54,8 @@ async def process_search_query(message: Message, state: FSMContext):
     
     try:
         logger.info(f"🔍 Поиск треков для: {query}")
-        search_task = asyncio.create_task(search_engine.search_tracks(query, limit=15))
+        # 🔥 Сначала только первая страница — она приходит быстрее всего
+        search_task = asyncio.create_task(search_engine.search_tracks(query, limit=SEARCH_PAGE_SIZE))
         tracks = await asyncio.wait_for(search_task, timeout=20)
         
         if not tracks:
@@ -62,12 +63,17 @@ async def process_search_query(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        await state.update_data(search_results=tracks, search_query=query, offset=0)
+        has_more = search_engine.has_more(tracks, SEARCH_PAGE_SIZE)
+        if has_more:
+            # Пока юзер читает первую страницу, следующая уже грузится в кэш — с тем же limit, что запросит «дальше»
+            search_engine.prefetch(query, search_engine.next_limit(len(tracks)))
         
-        results_text = format_search_results(tracks[:5], query, lang)
+        await state.update_data(search_results=tracks, search_query=query, offset=0, has_more=has_more)
+        
+        results_text = format_search_results(tracks[:5], query, lang, has_more=has_more, total=len(tracks))
         await loading_msg.edit_text(
             results_text,
-            reply_markup=get_track_selection_keyboard(tracks, lang, 0),
+            reply_markup=get_track_selection_keyboard(tracks, lang, 0, has_more),
             parse_mode="Markdown"
         )
         
@@ -125,6 +131,7 @@ async def navigate_search_results(callback: CallbackQuery, state: FSMContext):
     tracks = user_data.get('search_results', [])
     query = user_data.get('search_query', '')
     current_offset = user_data.get('offset', 0)
+    has_more = user_data.get('has_more', False)
     lang = await get_user_language_safe(callback.from_user.id)
     
     action = callback.data.split('_')[1]
@@ -132,7 +139,21 @@ async def navigate_search_results(callback: CallbackQuery, state: FSMContext):
     if action == 'prev':
         new_offset = max(0, current_offset - 5)
     elif action == 'next':
-        new_offset = min(len(tracks) - 5, current_offset + 5)
+        new_offset = current_offset + 5
+        if new_offset + 5 > len(tracks) and has_more:
+            # Дотягиваем страницу по требованию (обычно уже лежит в кэше после prefetch)
+            limit = search_engine.next_limit(len(tracks))
+            try:
+                more = await asyncio.wait_for(search_engine.search_tracks(query, limit=limit), timeout=20)
+            except asyncio.TimeoutError:
+                more = []
+            if len(more) > len(tracks):
+                tracks = more
+            has_more = search_engine.has_more(more, limit)
+            if has_more:
+                search_engine.prefetch(query, search_engine.next_limit(limit))
+            await state.update_data(search_results=tracks, has_more=has_more)
+        new_offset = max(0, min(len(tracks) - 5, new_offset))
     elif action == 'cancel':
         await callback.message.delete()
         await state.clear()
@@ -144,16 +165,16 @@ async def navigate_search_results(callback: CallbackQuery, state: FSMContext):
     
     await state.update_data(offset=new_offset)
     
-    results_text = format_search_results(tracks[new_offset:new_offset+5], query, lang, new_offset)
+    results_text = format_search_results(tracks[new_offset:new_offset+5], query, lang, new_offset, has_more, len(tracks))
     await callback.message.edit_text(
         results_text,
-        reply_markup=get_track_selection_keyboard(tracks, lang, new_offset),
+        reply_markup=get_track_selection_keyboard(tracks, lang, new_offset, has_more),
         parse_mode="Markdown"
     )
     
     await callback.answer()
 
-def format_search_results(tracks, query, lang, offset=0):
+def format_search_results(tracks, query, lang, offset=0, has_more=False, total=None):
     """Форматирование результатов поиска"""
     if not tracks:
         return "❌ Ничего не найдено"
@@ -167,10 +188,13 @@ def format_search_results(tracks, query, lang, offset=0):
         text += f"**{offset + i}. {track_title}**\n"
         text += f"   👤 {artist} | ⏱ {track['duration_formatted']}\n\n"
     
-    total_pages = (len(tracks) + 4) // 5
+    # tracks — только текущая страница, total — сколько всего уже загружено
+    total_loaded = total if total is not None else len(tracks)
+    total_pages = (total_loaded + 4) // 5
     current_page = offset // 5 + 1
+    more_mark = "+" if has_more else ""
     
-    text += f"📊 {get_text(lang, 'search_found_tracks').format(count=len(tracks))}"
-    text += f"\n📄 Страница {current_page}/{total_pages}"
+    text += f"📊 {get_text(lang, 'search_found_tracks').format(count=f'{total_loaded}{more_mark}')}"
+    text += f"\n📄 Страница {current_page}/{total_pages}{more_mark}"
     
     return text
\ No newline at end of file
@@ -30,7 +30,7 @@ def get_search_keyboard(language="ua"):
         [InlineKeyboardButton(text="🔍 Поиск треков", callback_data="search_tracks")]
     ])
 
-def get_track_selection_keyboard(tracks, language="ua", offset=0):
+def get_track_selection_keyboard(tracks, language="ua", offset=0, has_more=False):
     """Клавиатура для выбора трека с переводами"""
     from lang_bot.translations import get_text
     
@@ -59,7 +59,7 @@ def get_track_selection_keyboard(tracks, language="ua", offset=0):
             callback_data=f"search_prev"
         ))
     
-    if offset + 5 < len(tracks):
+    if offset + 5 < len(tracks) or has_more:
         nav_buttons.append(InlineKeyboardButton(
             text=f"{get_text(language, 'next_page')} ➡️", 
             callback_data=f"search_next"
@@ -54,6 +54,8 @@ TRANSLATIONS = {
         "database_status": "База даних",
         "queue_empty": "Черга порожня!",
         "total_in_queue": "Всього в черзі",
+        "processing_now": "Твоє завантаження вже йде",
+        "not_in_queue": "Тебе немає в черзі",
         "search_placeholder": "🔍 Введіть назву треку або артиста для пошуку...",
         "search_results": "🎵 Результати пошуку для \"{query}\":",
         "search_no_results": "❌ За вашим запитом \"{query}\" нічого не знайдено",
@@ -169,6 +171,8 @@ TRANSLATIONS = {
         "database_status": "База данных",
         "queue_empty": "Очередь пуста!",
         "total_in_queue": "Всего в очереди",
+        "processing_now": "Твоя загрузка уже идёт",
+        "not_in_queue": "Тебя нет в очереди",
         "search_placeholder": "🔍 Введите название трека или артиста для поиска...",
         "search_results": "🎵 Результаты поиска для \"{query}\":",
         "search_no_results": "❌ По вашему запросу \"{query}\" ничего не найдено",
@@ -270,6 +274,8 @@ TRANSLATIONS = {
         "database_status": "Database",
         "queue_empty": "Queue is empty!",
         "total_in_queue": "Total in queue",
+        "processing_now": "Your download is already in progress",
+        "not_in_queue": "You are not in the queue",
         "search_placeholder": "🔍 Enter track name or artist to search...",
         "search_results": "🎵 Search results for \"{query}\":",
         "search_no_results": "❌ Nothing found for \"{query}\"",
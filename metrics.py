@@ -0,0 +1,238 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}  # метки -> [счетчики по бакетам, сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        state = self._values.get(tuple(sorted(labels.items())))
+        return state[2] if state else 0
+
+    def render(self):
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+
+        lines = []
+        for key, bucket_counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = key + (("le", _format_value(float(bound))),)
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# 🔥 ОБЩИЕ МЕТРИКИ ГОРЯЧИХ ПУТЕЙ
+operation_seconds = registry.histogram("bot_operation_seconds", "Время выполнения операций сервисов")
+operation_errors = registry.counter("bot_operation_errors_total", "Операции сервисов, завершившиеся исключением")
+db_query_seconds = registry.histogram("bot_db_query_seconds", "Время выполнения методов Database")
+telegram_send_seconds = registry.histogram("bot_telegram_send_seconds", "Время отправки в Telegram")
+telegram_send_errors = registry.counter("bot_telegram_send_errors_total", "Неудачные отправки в Telegram")
+loop_lag_seconds = registry.histogram(
+    "bot_event_loop_lag_seconds", "Задержка цикла событий",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+loop_lag_max_seconds = registry.gauge("bot_event_loop_lag_max_seconds", "Максимальная задержка цикла событий за окно")
+
+def timed(histogram=operation_seconds, **labels):
+    """Декоратор для async функций: пишет длительность в histogram"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                operation_errors.inc(**labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+def instrument_methods(cls, histogram, label="method"):
+    """Оборачивает все публичные async методы класса в timed(histogram)"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_') or not asyncio.iscoroutinefunction(attr):
+            continue
+        setattr(cls, name, timed(histogram, **{label: name})(attr))
+    return cls
+
+class LoopLagMonitor:
+    """Периодически меряет, насколько цикл событий опаздывает с пробуждением"""
+
+    def __init__(self, interval=0.5, report_every=60):
+        self.interval = interval
+        self.report_every = report_every
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        window_max = 0.0
+        window_start = loop.time()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            loop_lag_seconds.observe(lag)
+            window_max = max(window_max, lag)
+
+            if loop.time() - window_start >= self.report_every:
+                loop_lag_max_seconds.set(window_max)
+                if window_max > 0.5:
+                    logger.warning(f"⚠️ Цикл событий тормозил до {window_max * 1000:.0f}мс")
+                window_max = 0.0
+                window_start = loop.time()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+loop_lag_monitor = LoopLagMonitor()
+
+async def start_http_server(port, host="0.0.0.0"):
+    """Поднимает /metrics для Prometheus, возвращает runner для остановки"""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -2,5 +2,7 @@ from .downloader import downloader
 from .file_processor import file_processor
 from .playlist_preview import playlist_preview
 from .search import search_engine
+from .track_store import track_store
+from .ydl_pool import ydl_pool
 
-__all__ = ['downloader', 'file_processor', 'playlist_preview', 'search_engine']
\ No newline at end of file
+__all__ = ['downloader', 'file_processor', 'playlist_preview', 'search_engine', 'track_store', 'ydl_pool']
\ No newline at end of file
@@ -1,45 +1,221 @@
-import yt_dlp
 import os
+import shutil
 import asyncio
 import logging
+import tempfile
+import threading
+
+from config import DOWNLOAD_TIMEOUT, DOWNLOAD_WORKERS, YOUTUBE_MAX_RETRIES
+from metrics import timed
+from .executors import download_executor
+from .track_store import track_store
+from .ydl_pool import ydl_pool
 
 logger = logging.getLogger(__name__)
 
+class DownloadAttempt:
+    """Одна попытка скачать трек в своей временной папке.
+
+    Файл переносится в папку задания только если попытку не бросили по
+    таймауту: брошенная попытка, дописав файл, молча удаляет его и не
+    попадает ни в хранилище треков, ни в кэш file_id.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.dir = None
+        self._lock = threading.Lock()
+        self._abandoned = False
+
+    def open(self):
+        self.dir = tempfile.mkdtemp(prefix='.attempt-', dir=self.output_dir)
+        return self.dir
+
+    def abandon(self):
+        with self._lock:
+            self._abandoned = True
+
+    def publish(self, file_path):
+        """Переносит готовый файл в папку задания, возвращает новый путь или None"""
+        with self._lock:
+            if self._abandoned:
+                return None
+            dest_path = os.path.join(self.output_dir, os.path.basename(file_path))
+            os.replace(file_path, dest_path)
+            return dest_path
+
+    def cleanup(self):
+        if self.dir:
+            shutil.rmtree(self.dir, ignore_errors=True)
+
+def _mark_started(future):
+    if not future.done():
+        future.set_result(None)
+
 class Downloader:
-    def get_ydl_opts(self, output_dir):
+    def __init__(self, workers=DOWNLOAD_WORKERS, track_timeout=DOWNLOAD_TIMEOUT, max_retries=YOUTUBE_MAX_RETRIES):
+        self.workers = max(1, workers)
+        self.track_timeout = track_timeout
+        self.max_retries = max(1, max_retries)
+
+    def make_entry(self, index, track_id, url, title):
+        track_id = '' if track_id is None else str(track_id)
         return {
-            'outtmpl': os.path.join(output_dir, '%(title).80s.%(ext)s'),
-            'format': 'bestaudio[ext=mp3]/bestaudio/best',
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': True,
-            'retries': 2,
+            'index': index,
+            'id': track_id,
+            'track_id': f"soundcloud:{track_id}" if track_id else None,
+            'url': url,
+            'title': title,
         }
-    
-    async def download_playlist(self, url, output_dir, user_id=None, bot=None, lang="ua", total_tracks=0):
+
+    async def extract_entries(self, url):
+        """Список треков плейлиста без скачивания.
+
+        Каждый трек: {'index', 'id', 'track_id', 'url', 'title'}, где track_id —
+        канонический ключ трека для кэшей ("soundcloud:<id>").
+        """
+        loop = asyncio.get_event_loop()
+        info = await loop.run_in_executor(download_executor, self._extract_flat_sync, url)
+
+        if not info:
+            return []
+
+        if 'entries' not in info:
+            return [self.make_entry(0, info.get('id'), info.get('webpage_url') or url, info.get('title'))]
+
+        entries = []
+        for entry in info.get('entries') or []:
+            if not entry or not entry.get('url'):
+                continue
+            entries.append(self.make_entry(len(entries), entry.get('id'), entry['url'], entry.get('title')))
+        return entries
+
+    def _extract_flat_sync(self, url):
+        with ydl_pool.checkout('flat') as ydl:
+            return ydl.extract_info(url, download=False)
+
+    def _download_track_sync(self, entry, output_dir, attempt):
+        cached_path = track_store.get(entry.get('track_id'), output_dir)
+        if cached_path:
+            return cached_path
+
+        try:
+            with ydl_pool.checkout('track', attempt.open()) as ydl:
+                info = ydl.extract_info(entry['url'], download=True)
+            if not info:
+                return None
+
+            for item in info.get('requested_downloads') or []:
+                file_path = item.get('filepath')
+                if file_path and os.path.exists(file_path):
+                    file_path = attempt.publish(file_path)
+                    if file_path:
+                        track_store.put(entry.get('track_id'), file_path)
+                    return file_path
+            return None
+        finally:
+            attempt.cleanup()
+
+    def _download_playlist_sync(self, url, output_dir):
+        with ydl_pool.checkout('playlist', output_dir) as ydl:
+            ydl.download([url])
+
+    async def download_track(self, entry, output_dir):
+        """Скачивает один трек со своими повторами и таймаутом.
+
+        Таймаут отсчитывается с момента, когда поток взялся за попытку, а не с
+        постановки в очередь пула. Поток yt-dlp он не останавливает (для этого
+        socket_timeout в профиле 'track'), поэтому у каждой попытки своя папка,
+        а результат брошенной попытки выбрасывается.
+        """
+        loop = asyncio.get_event_loop()
+
+        for attempt_number in range(1, self.max_retries + 1):
+            attempt = DownloadAttempt(output_dir)
+            started = loop.create_future()
+
+            def run(attempt=attempt, started=started):
+                loop.call_soon_threadsafe(_mark_started, started)
+                return self._download_track_sync(entry, output_dir, attempt)
+
+            task = loop.run_in_executor(download_executor, run)
+            try:
+                await asyncio.wait({started, task}, return_when=asyncio.FIRST_COMPLETED)
+                file_path = await asyncio.wait_for(task, timeout=self.track_timeout)
+                if file_path:
+                    return file_path
+                logger.warning(f"Трек не скачан ({attempt_number}/{self.max_retries}): {entry['url']}")
+            except asyncio.TimeoutError:
+                logger.warning(f"Таймаут трека ({attempt_number}/{self.max_retries}): {entry['url']}")
+            except Exception as e:
+                logger.warning(f"Ошибка трека ({attempt_number}/{self.max_retries}): {entry['url']}: {e}")
+            finally:
+                # Завершенной попытке это уже ничего не меняет
+                attempt.abandon()
+
+            if attempt_number < self.max_retries:
+                await asyncio.sleep(min(2 ** attempt_number, 10))
+
+        logger.error(f"Трек пропущен после {self.max_retries} попыток: {entry['url']}")
+        return None
+
+    async def download_entries(self, entries, output_dir, track_queue=None):
+        """Скачивает треки параллельно, не больше self.workers одновременно.
+
+        Если передан track_queue, по завершении каждого трека в него кладется
+        (трек, путь к файлу или None при ошибке).
+        """
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def worker(entry):
+            async with semaphore:
+                file_path = await self.download_track(entry, output_dir)
+            if track_queue is not None:
+                await track_queue.put((entry, file_path))
+            return file_path
+
+        results = await asyncio.gather(*(worker(entry) for entry in entries))
+        return [file_path for file_path in results if file_path]
+
+    @timed(operation="download_playlist")
+    async def download_playlist(self, url, output_dir, user_id=None, bot=None, lang="ua", total_tracks=0, parallel=True, track_queue=None, entries=None):
+        """Скачивает плейлист в output_dir.
+
+        Возвращает пути скачанных файлов в порядке плейлиста (пустой список,
+        если ничего не скачалось).
+        """
         logger.info(f"Начинаю загрузку: {url}")
-        
+
         try:
-            ydl_opts = self.get_ydl_opts(output_dir)
-            
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None, 
-                lambda: yt_dlp.YoutubeDL(ydl_opts).download([url])
-            )
-            
-            files = [f for f in os.listdir(output_dir) if f.endswith('.mp3')]
-            success = len(files) > 0
-            
-            if success:
+            if entries is None:
+                entries = await self.extract_entries(url) if parallel else []
+
+            if entries:
+                logger.info(f"Треков к загрузке: {len(entries)}, потоков: {self.workers}")
+                files = await self.download_entries(entries, output_dir, track_queue)
+            else:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(download_executor, self._download_playlist_sync, url, output_dir)
+
+                files = [
+                    os.path.join(output_dir, f) for f in sorted(os.listdir(output_dir))
+                    if not f.endswith(('.part', '.ytdl'))
+                ]
+
+                if track_queue is not None:
+                    for index, file_path in enumerate(files):
+                        entry = self.make_entry(index, None, url, os.path.basename(file_path))
+                        await track_queue.put((entry, file_path))
+
+            if files:
                 logger.info(f"Успешно! Файлов: {len(files)}")
             else:
                 logger.error("Не удалось скачать файлы")
-                
-            return success
-            
+
+            return files
+
         except Exception as e:
             logger.error(f"Ошибка загрузки: {e}")
-            return False
+            return []
 
-downloader = Downloader()
\ No newline at end of file
+downloader = Downloader()
@@ -0,0 +1,100 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import ARCHIVE_WORKERS, DOWNLOAD_POOL_WORKERS, PREVIEW_WORKERS, SEARCH_WORKERS
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+executor_queue_depth = registry.gauge("bot_executor_queue_depth", "Задачи, ждущие свободного потока")
+executor_active = registry.gauge("bot_executor_active_threads", "Потоки пула, занятые задачей")
+executor_max_workers = registry.gauge("bot_executor_max_workers", "Размер пула потоков")
+executor_saturated = registry.counter("bot_executor_saturated_total", "Задачи, поставленные в очередь при занятых потоках")
+executor_wait_seconds = registry.histogram(
+    "bot_executor_wait_seconds", "Ожидание свободного потока",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+class WorkloadExecutor(ThreadPoolExecutor):
+    """Пул потоков одного класса работы с метриками очереди.
+
+    Размер ограничен, очередь — нет: лишние задачи ждут, а не отклоняются.
+    Время ожидания и глубина очереди видны в /metrics по метке pool.
+    """
+
+    def __init__(self, name, max_workers):
+        max_workers = max(1, max_workers)
+        super().__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        self._state_lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        executor_max_workers.set(max_workers, pool=name)
+        executor_queue_depth.set(0, pool=name)
+        executor_active.set(0, pool=name)
+
+    def _publish(self):
+        executor_queue_depth.set(self._queued, pool=self.name)
+        executor_active.set(self._active, pool=self.name)
+
+    def submit(self, fn, /, *args, **kwargs):
+        submitted_at = time.perf_counter()
+
+        def run():
+            with self._state_lock:
+                self._queued -= 1
+                self._active += 1
+                self._publish()
+            executor_wait_seconds.observe(time.perf_counter() - submitted_at, pool=self.name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._state_lock:
+                    self._active -= 1
+                    self._publish()
+
+        with self._state_lock:
+            self._queued += 1
+            saturated = self._active + self._queued > self._max_workers
+            self._publish()
+        if saturated:
+            executor_saturated.inc(pool=self.name)
+
+        try:
+            future = super().submit(run)
+        except RuntimeError:
+            # Пул уже остановлен
+            with self._state_lock:
+                self._queued -= 1
+                self._publish()
+            raise
+
+        def forget_cancelled(done):
+            # Отмененная до старта задача так и не выйдет из очереди сама
+            if done.cancelled():
+                with self._state_lock:
+                    self._queued -= 1
+                    self._publish()
+
+        future.add_done_callback(forget_cancelled)
+        return future
+
+    def get_stats(self):
+        with self._state_lock:
+            return {'queued': self._queued, 'active': self._active, 'max_workers': self._max_workers}
+
+# 🔥 ПУЛЫ ПО КЛАССАМ РАБОТЫ: интерактивные запросы не стоят за загрузками
+search_executor = WorkloadExecutor("search", SEARCH_WORKERS)
+preview_executor = WorkloadExecutor("preview", PREVIEW_WORKERS)
+download_executor = WorkloadExecutor("download", DOWNLOAD_POOL_WORKERS)
+archive_executor = WorkloadExecutor("archive", ARCHIVE_WORKERS)
+
+EXECUTORS = (search_executor, preview_executor, download_executor, archive_executor)
+
+def shutdown_executors():
+    """Не ждет текущих задач и отменяет стоящие в очереди"""
+    for executor in EXECUTORS:
+        executor.shutdown(wait=False, cancel_futures=True)
+    logger.info("🧵 Пулы потоков остановлены")
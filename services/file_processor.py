@@ -1,8 +1,54 @@
 import zipfile
+import zlib
 import os
 import math
+import time
+import shutil
+import tempfile
+import asyncio
+from contextlib import asynccontextmanager
 
-def create_zip(source_dir, zip_path):
+from config import ARCHIVE_COMPRESSION, ZIP_KEEP_ORDER
+from .executors import archive_executor
+
+# Уже сжатые форматы: deflate тратит CPU и почти ничего не экономит
+COMPRESSED_EXTENSIONS = {
+    '.mp3', '.m4a', '.aac', '.opus', '.ogg', '.oga', '.webm', '.flac', '.wma',
+    '.mp4', '.jpg', '.jpeg', '.png', '.webp', '.zip', '.gz',
+}
+SAMPLE_SIZE = 64 * 1024
+MIN_DEFLATE_SAVING = 0.05
+
+def is_compressible_sample(file_path):
+    """Сжимает кусок из середины файла и смотрит, стоит ли deflate того"""
+    try:
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            f.seek(max(0, file_size // 2 - SAMPLE_SIZE // 2))
+            sample = f.read(SAMPLE_SIZE)
+    except OSError:
+        return False
+    
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * (1 - MIN_DEFLATE_SAVING)
+
+def get_compress_type(file_path, mode=None):
+    """Метод сжатия для файла в архиве в зависимости от режима"""
+    mode = mode or ARCHIVE_COMPRESSION
+    
+    if mode == 'stored':
+        return zipfile.ZIP_STORED
+    if mode == 'deflated':
+        return zipfile.ZIP_DEFLATED
+    
+    if os.path.splitext(file_path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    if mode == 'sample':
+        return zipfile.ZIP_DEFLATED if is_compressible_sample(file_path) else zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def create_zip(source_dir, zip_path, mode=None):
     """Создает ZIP архив из директории"""
     try:
         with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
@@ -12,7 +58,7 @@ def create_zip(source_dir, zip_path):
                     # 🔥 ИСПРАВЛЕНО: проверяем что файл существует и доступен
                     if os.path.exists(file_path) and os.path.isfile(file_path):
                         arcname = os.path.relpath(file_path, source_dir)
-                        zipf.write(file_path, arcname)
+                        zipf.write(file_path, arcname, compress_type=get_compress_type(file_path, mode))
         return True
     except Exception as e:
         print(f"❌ Ошибка создания ZIP: {e}")
@@ -35,9 +81,142 @@ def get_files_in_directory(directory):
         print(f"❌ Ошибка чтения директории: {e}")
     return files
 
-def create_zip_parts(source_dir, zip_base_path, max_part_size=45*1024*1024):
-    """Создает ZIP архив, разбитый на части по 45MB"""
-    current_zip = None
+def collect_files(source_dir):
+    """Собирает файлы для архивации: [(имя, путь), ...] по алфавиту"""
+    all_files = []
+    for root, dirs, files in os.walk(source_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if os.path.exists(file_path) and os.path.isfile(file_path):
+                all_files.append((file, file_path))
+    return sorted(all_files)
+
+def zip_entry_size(arcname, size, compress_type=zipfile.ZIP_STORED):
+    """Оценка места, которое файл займет в архиве, вместе с заголовками"""
+    name_len = len(arcname.encode('utf-8'))
+    # локальный заголовок + запись центрального каталога + дескриптор данных
+    overhead = 30 + 46 + 16 + 2 * name_len
+    if compress_type == zipfile.ZIP_DEFLATED:
+        # несжимаемые данные deflate слегка раздувает
+        overhead += size // 1000 + 64
+    return size + overhead
+
+def plan_zip_parts(all_files, max_part_size=45*1024*1024, keep_order=False, mode=None):
+    """Раскладывает файлы по минимальному числу частей, не превышая max_part_size.
+    
+    По умолчанию — First Fit Decreasing: крупные файлы раскладываются первыми,
+    мелкие добивают свободное место. С keep_order=True части заполняются
+    подряд в порядке all_files, чтобы архив шел в порядке плейлиста.
+    Внутри части файлы всегда идут в исходном порядке.
+    
+    Файл больше части режется на тома "имя.001", "имя.002", ... — каждый
+    в своей части; собрать обратно: cat имя.0* > имя.
+    Элемент плана: (имя в архиве, путь, смещение, длина или None для всего файла).
+    """
+    capacity = max_part_size - 22  # запись конца центрального каталога
+    items = []  # (порядковый номер, размер в архиве, элемент плана)
+    
+    for file_name, file_path in all_files:
+        # 🔥 ИСПРАВЛЕНО: проверяем что можем прочитать файл
+        if not os.access(file_path, os.R_OK):
+            print(f"⚠️ Нет доступа к файлу: {file_name}")
+            continue
+        
+        file_size = os.path.getsize(file_path)
+        entry_size = zip_entry_size(file_name, file_size, get_compress_type(file_path, mode))
+        
+        if entry_size <= capacity:
+            items.append((len(items), entry_size, (file_name, file_path, 0, None)))
+            continue
+        
+        # Файл не влезает в одну часть — режем на тома без сжатия
+        chunk_size = capacity - zip_entry_size(f"{file_name}.000", 0)
+        volumes = math.ceil(file_size / chunk_size)
+        print(f"⚠️ Файл {file_name} слишком большой ({file_size/1024/1024:.1f}MB), делим на {volumes} томов")
+        
+        for volume in range(volumes):
+            offset = volume * chunk_size
+            length = min(chunk_size, file_size - offset)
+            volume_name = f"{file_name}.{volume + 1:03d}"
+            items.append((len(items), zip_entry_size(volume_name, length), (volume_name, file_path, offset, length)))
+    
+    parts = []
+    free = []
+    
+    if keep_order:
+        for item in items:
+            if not parts or free[-1] < item[1]:
+                parts.append([])
+                free.append(capacity)
+            parts[-1].append(item)
+            free[-1] -= item[1]
+    else:
+        for item in sorted(items, key=lambda x: x[1], reverse=True):
+            for index, space in enumerate(free):
+                if space >= item[1]:
+                    break
+            else:
+                parts.append([])
+                free.append(capacity)
+                index = len(parts) - 1
+            parts[index].append(item)
+            free[index] -= item[1]
+    
+    return [[entry for _, _, entry in sorted(part)] for part in parts]
+
+def write_zip_part(part_files, part_path, mode=None):
+    """Записывает одну часть архива, возвращает True если в ней есть файлы"""
+    added = 0
+    try:
+        # 🔥 ИСПРАВЛЕНО: используем with для автоматического закрытия
+        with zipfile.ZipFile(part_path, 'w', zipfile.ZIP_DEFLATED) as current_zip:
+            for file_name, file_path, offset, length in part_files:
+                try:
+                    if length is None:
+                        current_zip.write(file_path, file_name, compress_type=get_compress_type(file_path, mode))
+                    else:
+                        write_zip_volume(current_zip, file_name, file_path, offset, length)
+                    added += 1
+                except Exception as e:
+                    print(f"❌ Ошибка добавления файла {file_name} в архив: {e}")
+    except Exception as e:
+        print(f"❌ Ошибка создания части архива {part_path}: {e}")
+        return False
+    
+    if not added and os.path.exists(part_path):
+        os.remove(part_path)
+    return added > 0
+
+def write_zip_volume(current_zip, volume_name, file_path, offset, length):
+    """Кладет в архив кусок файла [offset, offset + length) как отдельный том"""
+    zinfo = zipfile.ZipInfo(volume_name, time.localtime(os.path.getmtime(file_path))[:6])
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.file_size = length
+    
+    with open(file_path, 'rb') as src, current_zip.open(zinfo, 'w') as dst:
+        src.seek(offset)
+        remaining = length
+        while remaining > 0:
+            block = src.read(min(1024 * 1024, remaining))
+            if not block:
+                break
+            dst.write(block)
+            remaining -= len(block)
+
+def list_zip_sources(source_dir, files=None):
+    if files is None:
+        return collect_files(source_dir)
+    return [(os.path.basename(path), path) for path in files if os.path.isfile(path)]
+
+def get_part_path(zip_base_path, part_num):
+    return f"{zip_base_path}.part{part_num:03d}.zip"
+
+def create_zip_parts(source_dir, zip_base_path, max_part_size=45*1024*1024, mode=None, keep_order=ZIP_KEEP_ORDER, files=None):
+    """Создает ZIP архив, разбитый на части по 45MB.
+    
+    files — необязательный список путей в нужном порядке (например, порядок
+    плейлиста); по умолчанию берутся все файлы из source_dir.
+    """
     zip_parts = []
     
     try:
@@ -45,78 +224,76 @@ def create_zip_parts(source_dir, zip_base_path, max_part_size=45*1024*1024):
         if not os.path.exists(source_dir):
             print(f"❌ Исходная директория не существует: {source_dir}")
             return []
-            
-        # Собираем все файлы
-        all_files = []
-        for root, dirs, files in os.walk(source_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if os.path.exists(file_path) and os.path.isfile(file_path):
-                    all_files.append((file, file_path))
+        
+        all_files = list_zip_sources(source_dir, files)
         
         # 🔥 ИСПРАВЛЕНО: проверяем что есть файлы для архивации
         if not all_files:
             print("❌ Нет файлов для архивации")
             return []
         
-        # Сортируем файлы по размеру (оптимально для упаковки)
-        all_files.sort(key=lambda x: os.path.getsize(x[1]))
-        
-        part_num = 1
-        current_part_size = 0
-        
-        for file_name, file_path in all_files:
-            file_size = os.path.getsize(file_path)
-            
-            # 🔥 ИСПРАВЛЕНО: проверяем что можем прочитать файл
-            if not os.access(file_path, os.R_OK):
-                print(f"⚠️ Нет доступа к файлу: {file_name}")
-                continue
-            
-            # Если файл сам по себе больше максимального размера части
-            if file_size > max_part_size:
-                print(f"⚠️ Файл {file_name} слишком большой ({file_size/1024/1024:.1f}MB), пропускаем")
-                continue
-            
-            # Если нужно начать новую часть
-            if current_zip is None or current_part_size + file_size > max_part_size:
-                if current_zip is not None:
-                    current_zip.close()
-                    current_zip = None
-                
-                # Создаем новую часть
-                current_zip_path = f"{zip_base_path}.part{part_num:03d}.zip"
-                try:
-                    # 🔥 ИСПРАВЛЕНО: используем with для автоматического закрытия
-                    current_zip = zipfile.ZipFile(current_zip_path, 'w', zipfile.ZIP_DEFLATED)
-                    zip_parts.append(current_zip_path)
-                    current_part_size = 0
-                    part_num += 1
-                except Exception as e:
-                    print(f"❌ Ошибка создания части архива {current_zip_path}: {e}")
-                    continue
-            
-            # Добавляем файл в текущую часть
-            try:
-                arcname = file_name
-                current_zip.write(file_path, arcname)
-                current_part_size += file_size
-            except Exception as e:
-                print(f"❌ Ошибка добавления файла {file_name} в архив: {e}")
-                continue
+        for part_num, part_files in enumerate(plan_zip_parts(all_files, max_part_size, keep_order, mode), 1):
+            part_path = get_part_path(zip_base_path, part_num)
+            if write_zip_part(part_files, part_path, mode):
+                zip_parts.append(part_path)
         
         return zip_parts
         
     except Exception as e:
         print(f"❌ Ошибка создания частей архива: {e}")
-        return []
+        return zip_parts
+
+def get_total_size(paths):
+    """Суммарный размер существующих файлов в байтах"""
+    return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+async def iter_zip_parts(source_dir, zip_base_path, max_part_size=45*1024*1024, mode=None, keep_order=ZIP_KEEP_ORDER, files=None, executor=None):
+    """Потоково собирает архив: отдает (путь, номер, всего) по готовности каждой части.
+    
+    Части пишутся в рабочем потоке. Пока вызывающий код отправляет часть N,
+    уже собирается часть N+1, поэтому загрузка в Telegram и архивация
+    идут одновременно, а цикл событий не блокируется.
+    """
+    loop = asyncio.get_running_loop()
+    
+    if not os.path.exists(source_dir):
+        print(f"❌ Исходная директория не существует: {source_dir}")
+        return
+    
+    all_files = await loop.run_in_executor(executor, list_zip_sources, source_dir, files)
+    if not all_files:
+        print("❌ Нет файлов для архивации")
+        return
+    
+    plan = await loop.run_in_executor(executor, plan_zip_parts, all_files, max_part_size, keep_order, mode)
+    total_parts = len(plan)
+    if not total_parts:
+        return
+    
+    def build(index):
+        return loop.run_in_executor(executor, write_zip_part, plan[index], get_part_path(zip_base_path, index + 1), mode)
+    
+    next_index = 0
+    next_build = build(0)
+    try:
+        while next_build is not None:
+            index = next_index
+            built = await next_build
+            next_index = index + 1
+            next_build = build(next_index) if next_index < total_parts else None
+            
+            if built:
+                yield get_part_path(zip_base_path, index + 1), index + 1, total_parts
+            else:
+                print(f"❌ Часть архива {index + 1}/{total_parts} не создана")
     finally:
-        # 🔥 ИСПРАВЛЕНО: гарантированное закрытие ZIP файла
-        if current_zip is not None:
+        # Если отправку прервали — дожидаемся начатой части и удаляем ее
+        if next_build is not None:
             try:
-                current_zip.close()
-            except:
+                await next_build
+            except Exception:
                 pass
+            await loop.run_in_executor(executor, cleanup_zip_parts, [get_part_path(zip_base_path, next_index + 1)])
 
 def cleanup_zip_parts(zip_parts):
     """Очищает временные ZIP части"""
@@ -129,17 +306,61 @@ def cleanup_zip_parts(zip_parts):
             print(f"⚠️ Не удалось удалить {part_path}: {e}")
 
 class FileProcessor:
-    def create_zip(self, source_dir, zip_path):
-        return create_zip(source_dir, zip_path)
+    """Работа с файлами и архивами.
+    
+    Синхронные методы блокируют поток и годятся только для скриптов.
+    В обработчиках используются *_async методы: они выполняются в отдельном
+    ограниченном пуле потоков и не тормозят ответы другим пользователям.
+    """
+    
+    def __init__(self, executor=archive_executor):
+        self._executor = executor
+    
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    def create_zip(self, source_dir, zip_path, mode=None):
+        return create_zip(source_dir, zip_path, mode)
     
     def get_files_in_directory(self, directory):
         return get_files_in_directory(directory)
     
-    def create_zip_parts(self, source_dir, zip_base_path, max_part_size=45*1024*1024):
-        return create_zip_parts(source_dir, zip_base_path, max_part_size)
+    def create_zip_parts(self, source_dir, zip_base_path, max_part_size=45*1024*1024, mode=None, keep_order=ZIP_KEEP_ORDER, files=None):
+        return create_zip_parts(source_dir, zip_base_path, max_part_size, mode, keep_order, files)
+    
+    def iter_zip_parts(self, source_dir, zip_base_path, max_part_size=45*1024*1024, mode=None, keep_order=ZIP_KEEP_ORDER, files=None):
+        return iter_zip_parts(source_dir, zip_base_path, max_part_size, mode, keep_order, files, executor=self._executor)
     
     def cleanup_zip_parts(self, zip_parts):
         """🔥 ДОБАВЛЕНО: метод для очистки временных файлов"""
         cleanup_zip_parts(zip_parts)
+    
+    async def create_zip_async(self, source_dir, zip_path, mode=None):
+        return await self._run(create_zip, source_dir, zip_path, mode)
+    
+    async def get_files_in_directory_async(self, directory):
+        return await self._run(get_files_in_directory, directory)
+    
+    async def get_total_size_async(self, paths):
+        return await self._run(get_total_size, list(paths))
+    
+    async def create_zip_parts_async(self, source_dir, zip_base_path, max_part_size=45*1024*1024, mode=None, keep_order=ZIP_KEEP_ORDER, files=None):
+        return await self._run(create_zip_parts, source_dir, zip_base_path, max_part_size, mode, keep_order, files)
+    
+    async def cleanup_zip_parts_async(self, zip_parts):
+        await self._run(cleanup_zip_parts, list(zip_parts))
+    
+    async def remove_tree_async(self, path):
+        await self._run(shutil.rmtree, path, True)
+    
+    @asynccontextmanager
+    async def temp_dir(self, prefix=None):
+        """Асинхронный аналог tempfile.TemporaryDirectory: удаление идет в пуле"""
+        path = await self._run(tempfile.mkdtemp, None, prefix)
+        try:
+            yield path
+        finally:
+            await self.remove_tree_async(path)
 
-file_processor = FileProcessor()
\ No newline at end of file
+file_processor = FileProcessor()
@@ -1,115 +1,207 @@
-import yt_dlp
 import re
 from aiogram import types
 from io import BytesIO
 import requests
 import asyncio
 import logging
+from itertools import islice
 from lang_bot.translations import get_text
+from core import SingleFlight
+from urls import canonicalize_url
+from metrics import timed
+from .executors import preview_executor
+from .ydl_pool import ydl_pool
 
 logger = logging.getLogger(__name__)
 
+# Размер страницы совпадает с максимальной страницей API SoundCloud
+PREVIEW_PAGE_SIZE = 200
+
 class PlaylistPreview:
-    def get_ydl_opts(self):
-        return {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-            'ignoreerrors': True,
-            'retries': 2,
-        }
+    def __init__(self):
+        self._flights = SingleFlight("preview")
+        self._background = set()
     
+    @timed(operation="get_content_info")
     async def get_content_info(self, url, message=None, lang="ua"):
+        loading_msg = None
         try:
             if message:
                 loading_msg = await message.answer(get_text(lang, "getting_info"))
             
-            db = self.get_db()
-            if db:
-                cached_playlist, cached_tracks = await db.get_cached_playlist(url)
-                if cached_playlist:
-                    if loading_msg:
-                        try:
-                            await loading_msg.delete()
-                        except:
-                            pass
-                    return cached_playlist
-            
-            loop = asyncio.get_event_loop()
-            info = await loop.run_in_executor(
-                None, 
-                lambda: yt_dlp.YoutubeDL(self.get_ydl_opts()).extract_info(url, download=False)
-            )
+            # 🔥 Одна и та же ссылка от многих юзеров сразу — один extract_info на всех.
+            # Общий результат и кэш без локализованного текста: язык подставляется каждому свой
+            content_info = await self._flights.do(canonicalize_url(url), lambda: self._load_content_info(url))
+            return self._localize(content_info, lang)
             
+        except Exception as e:
+            logger.error(f"Ошибка получения информации: {e}")
+            return {
+                'type': 'error',
+                'title': get_text(lang, 'unknown_playlist'),
+                'track_count': 0,
+                'user': get_text(lang, 'unknown_artist'),
+                'error': str(e)
+            }
+        finally:
+            if loading_msg:
+                try:
+                    await loading_msg.delete()
+                except:
+                    pass
+
+    def _localize(self, content_info, lang):
+        """Копия для одного юзера: пустые название и автор заменяются текстом на его языке"""
+        localized = dict(content_info)
+        localized['title'] = content_info.get('title') or get_text(lang, 'unknown_playlist')
+        localized['user'] = content_info.get('user') or get_text(lang, 'unknown_artist')
+        return localized
+
+    def _open_entries(self, ydl, url):
+        """extract_info без обработки: entries остаются ленивыми (генератор/PagedList)"""
+        info = ydl.extract_info(url, download=False, process=False)
+        for _ in range(3):
+            if not info or info.get('_type') not in ('url', 'url_transparent'):
+                break
+            info = ydl.extract_info(info['url'], download=False, process=False)
+        return info
+
+    async def iter_entry_pages(self, url, page_size=PREVIEW_PAGE_SIZE):
+        """Отдает (info, страница треков, последняя ли) по мере извлечения.
+        
+        Весь плейлист в памяти не собирается: каждая страница тянется из
+        ленивых entries yt-dlp отдельным вызовом в пуле потоков превью. Ленивые
+        entries держат ссылку на свой YoutubeDL, поэтому экземпляр из пула
+        возвращается только когда генератор исчерпан или закрыт.
+        """
+        loop = asyncio.get_event_loop()
+        # Новый экземпляр (если пул пуст) создается не в цикле событий
+        ydl = await loop.run_in_executor(preview_executor, ydl_pool.acquire, 'flat')
+        try:
+            info = await loop.run_in_executor(preview_executor, self._open_entries, ydl, url)
             if not info:
-                return {
-                    'type': 'error',
-                    'title': get_text(lang, 'unknown_playlist'),
-                    'track_count': 0,
-                    'user': get_text(lang, 'unknown_artist'),
-                }
+                return
+            
+            entries = info.get('entries')
+            if entries is None:
+                yield info, [], True
+                return
             
+            iterator = iter(entries)
+            while True:
+                raw = await loop.run_in_executor(preview_executor, lambda: list(islice(iterator, page_size)))
+                is_last = len(raw) < page_size
+                yield info, [entry for entry in raw if entry], is_last
+                if is_last:
+                    return
+        finally:
+            ydl_pool.release('flat', ydl)
+
+    def _tracks_data(self, page, offset):
+        return [{'title': track.get('title') or f'Track {offset + i + 1}'} for i, track in enumerate(page)]
+
+    async def _load_content_info(self, url):
+        db = self.get_db()
+        if db:
+            cached_playlist, _ = await db.get_cached_playlist(url, with_tracks=False)
+            if cached_playlist:
+                return cached_playlist
+        
+        pages = self.iter_entry_pages(url)
+        try:
+            info, first_page, is_last = await pages.__anext__()
+        except StopAsyncIteration:
+            info = None
+        
+        if not info:
+            return {
+                'type': 'error',
+                'title': None,
+                'track_count': 0,
+                'user': None,
+            }
+        
+        # До передачи в фон генератор держит экземпляр YoutubeDL из пула — при ошибке закрываем его
+        try:
             content_type = "track"
             track_count = 1
+            track_count_partial = False
             
-            if info.get('_type') == 'playlist':
+            if 'entries' in info:
                 content_type = "playlist"
-                entries = info.get('entries', [])
+                entries = info.get('entries')
                 if isinstance(entries, list):
-                    track_count = len(entries)
+                    track_count = len([entry for entry in entries if entry])
+                elif is_last:
+                    track_count = len(first_page)
+                elif info.get('playlist_count'):
+                    track_count = info['playlist_count']
                 else:
-                    track_count = info.get('playlist_count', 1)
-            elif 'entries' in info and isinstance(info['entries'], list):
-                if len(info['entries']) > 1:
-                    content_type = "playlist"
-                    track_count = len(info['entries'])
+                    # 🔥 Лайки/репосты на тысячи треков: показываем превью после первой страницы
+                    track_count = len(first_page)
+                    track_count_partial = True
             
             cover_url = info.get('thumbnail', '')
             
             raw_title = info.get('title', '')
-            clean_title = self.clean_filename(raw_title, lang) or get_text(lang, 'unknown_playlist')
+            clean_title = self.clean_filename(raw_title)
             
-            user = info.get('uploader') or info.get('channel') or get_text(lang, 'unknown_artist')
+            user = info.get('uploader') or info.get('channel') or None
             
             content_info = {
                 'type': content_type,
                 'title': clean_title,
                 'cover_url': cover_url,
                 'track_count': track_count,
+                'track_count_partial': track_count_partial,
                 'user': user,
                 'url': url,
             }
             
-            if db:
-                tracks_data = []
-                if content_type == "playlist" and info.get('entries'):
-                    tracks_data = [{'title': track.get('title', f'Track {i+1}')} for i, track in enumerate(info.get('entries', []))]
-                else:
-                    tracks_data = [{'title': info.get('title', 'Unknown Track')}]
-                
-                await db.cache_playlist(url, content_info, tracks_data)
+            if not db:
+                await pages.aclose()
+                return content_info
+            
+            if content_type == "playlist":
+                tracks_data = self._tracks_data(first_page, 0)
+            else:
+                tracks_data = [{'title': info.get('title', 'Unknown Track')}]
+            await db.cache_playlist(url, content_info, tracks_data)
             
-            return content_info
+            if is_last:
+                await pages.aclose()
+            else:
+                # Остальные страницы дописываются в кэш в фоне, превью уже можно показывать
+                task = asyncio.create_task(self._store_remaining_pages(db, url, pages, content_info, len(first_page)))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+        except Exception:
+            await pages.aclose()
+            raise
+        
+        return content_info
+
+    async def _store_remaining_pages(self, db, url, pages, content_info, track_count):
+        chunk_index = 0
+        try:
+            async for _, page, _ in pages:
+                chunk_index += 1
+                await db.append_playlist_tracks(url, chunk_index, self._tracks_data(page, track_count))
+                track_count += len(page)
             
+            if content_info.get('track_count_partial'):
+                content_info = dict(content_info, track_count=track_count, track_count_partial=False)
+                await db.update_cached_playlist(url, content_info)
+            logger.info(f"Плейлист извлечен полностью: {url} ({track_count} треков, {chunk_index + 1} кусков)")
         except Exception as e:
-            logger.error(f"Ошибка получения информации: {e}")
-            return {
-                'type': 'error',
-                'title': get_text(lang, 'unknown_playlist'),
-                'track_count': 0,
-                'user': get_text(lang, 'unknown_artist'),
-                'error': str(e)
-            }
+            logger.error(f"Ошибка фонового извлечения {url}: {e}")
         finally:
-            if 'loading_msg' in locals():
-                try:
-                    await loading_msg.delete()
-                except:
-                    pass
+            await pages.aclose()
 
-    def clean_filename(self, filename, lang="ua"):
+    def clean_filename(self, filename):
+        """Название без запрещенных в именах файлов символов; None, если ничего не осталось"""
         if not filename:
-            return get_text(lang, 'unknown')
+            return None
         
         cleaned = re.sub(r'[<>:"/\\|?*]', '', filename)
         cleaned = cleaned.strip()
@@ -117,7 +209,7 @@ class PlaylistPreview:
         if len(cleaned) > 50:
             cleaned = cleaned[:47] + "..."
         
-        return cleaned if cleaned else get_text(lang, 'unknown')
+        return cleaned or None
     
     def set_db(self, db_instance):
         self.db = db_instance
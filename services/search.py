@@ -1,20 +1,95 @@
-import yt_dlp
+import os
+import re
 import asyncio
 import logging
 import hashlib
+import unicodedata
+
+from core import LRUCache, SingleFlight
+from metrics import registry, timed
+from .executors import search_executor
+from .ydl_pool import ydl_pool
 
 logger = logging.getLogger(__name__)
 
+# 🔥 КЭШ ПОИСКА: одинаковые запросы разных юзеров отвечают из памяти
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "1000"))
+
+# 🔥 ЛЕНИВЫЕ СТРАНИЦЫ: сначала одна страница, дальше подгрузка по мере листания
+SEARCH_PAGE_SIZE = 5
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", "100"))
+
+search_cache_lookups = registry.counter("bot_search_cache_lookups_total", "Поиск запросов в кэше поиска")
+
+def normalize_query(query):
+    """Ключ кэша: регистр, юникод-формы и пробелы не влияют на результат поиска"""
+    query = unicodedata.normalize('NFKC', query or '').casefold()
+    return re.sub(r'\s+', ' ', query).strip()
+
 class SoundCloudSearch:
-    def __init__(self):
-        self.ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-            'ignoreerrors': True,
-        }
+    def __init__(self, cache_size=SEARCH_CACHE_SIZE, cache_ttl=SEARCH_CACHE_TTL):
+        self._cache = LRUCache(cache_size, ttl=cache_ttl)  # запрос -> (запрошенный limit, треки)
+        self._flights = SingleFlight("search")
+        self._prefetches = set()
     
+    @timed(operation="search_tracks")
     async def search_tracks(self, query, limit=10):
+        """Поиск треков с кэшем по нормализованному запросу.
+        
+        Выдача с большим limit обслуживает и меньшие: первые N треков
+        scsearch не зависят от того, сколько запрошено всего.
+        """
+        query = normalize_query(query)
+        
+        cached = self._cache.get(query)
+        if cached is not None:
+            cached_limit, tracks = cached
+            # Выдача короче своего limit — результатов больше нет, ее хватит на любой limit
+            if cached_limit >= limit or len(tracks) < cached_limit:
+                search_cache_lookups.inc(result="hit")
+                return tracks[:limit]
+        search_cache_lookups.inc(result="miss")
+        
+        # Одновременные запросы ждут одну выдачу: идущая с большим limit обслуживает и меньшие
+        tracks = await self._flights.do(query, lambda: self._search(query, limit), size=limit)
+        return tracks[:limit]
+    
+    async def _search(self, query, limit):
+        tracks = await self._fetch_tracks(query, limit)
+        if tracks:
+            # Пустую выдачу (ошибка или сбой сети) не кэшируем; меньшая выдача не затирает большую
+            cached = self._cache.get(query)
+            if cached is None or cached[0] < limit:
+                self._cache.set(query, (limit, tracks))
+        return tracks
+    
+    def prefetch(self, query, limit):
+        """Подгружает выдачу в кэш в фоне, пока юзер смотрит текущую страницу"""
+        task = asyncio.create_task(self.search_tracks(query, min(limit, SEARCH_MAX_RESULTS)))
+        self._prefetches.add(task)
+        task.add_done_callback(self._prefetches.discard)
+        return task
+    
+    def next_limit(self, limit):
+        """limit следующей подгрузки: и для prefetch, и для кнопки «дальше».
+        
+        У scsearch нет смещения — каждая подгрузка тянет выдачу с начала,
+        поэтому limit удваивается, а не растет на страницу: суммарная работа
+        остается пропорциональной числу просмотренных результатов.
+        """
+        return min(SEARCH_MAX_RESULTS, max(limit * 2, limit + SEARCH_PAGE_SIZE))
+    
+    def has_more(self, tracks, limit):
+        """Есть ли смысл запрашивать следующую страницу"""
+        return len(tracks) >= limit and limit < SEARCH_MAX_RESULTS
+    
+    def _extract_info(self, url):
+        """extract_info на экземпляре из пула (вызывается в потоке)"""
+        with ydl_pool.checkout('flat') as ydl:
+            return ydl.extract_info(url, download=False)
+    
+    async def _fetch_tracks(self, query, limit):
         """Поиск треков через yt-dlp"""
         try:
             logger.info(f"🔍 Поиск: {query}")
@@ -22,11 +97,7 @@ class SoundCloudSearch:
             search_url = f"scsearch{limit}:{query}"
             
             loop = asyncio.get_event_loop()
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                info = await loop.run_in_executor(
-                    None, 
-                    lambda: ydl.extract_info(search_url, download=False)
-                )
+            info = await loop.run_in_executor(search_executor, self._extract_info, search_url)
             
             if not info or 'entries' not in info:
                 logger.error("❌ Не удалось получить результаты поиска")
@@ -90,11 +161,7 @@ class SoundCloudSearch:
             logger.info(f"🔍 Получение информации о треке: {track_url}")
             
             loop = asyncio.get_event_loop()
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                info = await loop.run_in_executor(
-                    None, 
-                    lambda: ydl.extract_info(track_url, download=False)
-                )
+            info = await loop.run_in_executor(search_executor, self._extract_info, track_url)
             
             if not info:
                 logger.error("❌ Не удалось получить информацию о треке")
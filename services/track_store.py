@@ -0,0 +1,154 @@
+import os
+import re
+import shutil
+import uuid
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+
+from config import TRACK_STORE_MAX_MB
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+store_lookups = registry.counter("bot_track_store_lookups_total", "Поиск треков в локальном хранилище")
+store_evictions = registry.counter("bot_track_store_evictions_total", "Треки, вытесненные из локального хранилища")
+
+TRACK_STORE_DIR = os.environ.get("TRACK_STORE_DIR", os.path.join(tempfile.gettempdir(), "music_bot_tracks"))
+
+class TrackStore:
+    """Локальное хранилище скачанных треков с LRU-вытеснением по объему.
+
+    Каждый трек лежит в своей папке root/<ключ>/<имя файла>. В папку задания
+    трек попадает хардлинком, поэтому вытеснение из хранилища не ломает файлы,
+    которые сейчас отправляются. Методы вызываются из потоков загрузчика.
+    """
+
+    def __init__(self, root=TRACK_STORE_DIR, max_bytes=TRACK_STORE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # ключ -> (папка, размер)
+        self._size = 0
+        self._loaded = False
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _key(self, track_id):
+        return re.sub(r'[^\w.-]', '_', track_id)
+
+    def _load(self):
+        """Поднимает индекс с диска, порядок LRU — по mtime папок"""
+        if self._loaded:
+            return
+        os.makedirs(self.root, exist_ok=True)
+
+        items = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith('.tmp-'):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            if not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            items.append((os.path.getmtime(path), name, path, size))
+
+        for _, name, path, size in sorted(items):
+            self._index[name] = (path, size)
+            self._size += size
+
+        self._loaded = True
+        self._evict()
+        logger.info(f"Хранилище треков: {len(self._index)} треков, {self._size / 1024 / 1024:.1f}MB")
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._index:
+            name, (path, size) = self._index.popitem(last=False)
+            self._size -= size
+            shutil.rmtree(path, ignore_errors=True)
+            store_evictions.inc()
+            logger.debug(f"Вытеснен из хранилища: {name}")
+
+    def _place(self, src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    def get(self, track_id, dest_dir):
+        """Кладет трек из хранилища в dest_dir, возвращает путь или None"""
+        if not self.enabled or not track_id:
+            return None
+
+        key = self._key(track_id)
+        with self._lock:
+            self._load()
+            item = self._index.get(key)
+            if not item:
+                store_lookups.inc(result="miss")
+                return None
+            self._index.move_to_end(key)
+
+        path = item[0]
+        try:
+            file_name = next(name for name in os.listdir(path) if os.path.isfile(os.path.join(path, name)))
+            src_path = os.path.join(path, file_name)
+            dest_path = os.path.join(dest_dir, file_name)
+            if os.path.exists(dest_path) and not os.path.samefile(src_path, dest_path):
+                # Имя занято другим треком задания (одинаковые названия) — кладем под ключом
+                stem, ext = os.path.splitext(file_name)
+                dest_path = os.path.join(dest_dir, f"{stem} [{key}]{ext}")
+            if not os.path.exists(dest_path):
+                self._place(src_path, dest_path)
+            os.utime(path)
+            store_lookups.inc(result="hit")
+            return dest_path
+        except (OSError, StopIteration):
+            # Трек вытеснили между поиском и линковкой — считаем промахом
+            store_lookups.inc(result="miss")
+            return None
+
+    def put(self, track_id, file_path):
+        """Сохраняет скачанный трек в хранилище (файл в папке задания не трогается)"""
+        if not self.enabled or not track_id or not os.path.isfile(file_path):
+            return
+
+        size = os.path.getsize(file_path)
+        if size > self.max_bytes:
+            return
+
+        key = self._key(track_id)
+        with self._lock:
+            self._load()
+            if key in self._index:
+                self._index.move_to_end(key)
+                return
+
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        target = os.path.join(self.root, key)
+        try:
+            os.makedirs(tmp_dir)
+            self._place(file_path, os.path.join(tmp_dir, os.path.basename(file_path)))
+            os.rename(tmp_dir, target)
+        except OSError as e:
+            # Параллельный писатель успел первым, либо нет места на диске
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.debug(f"Трек не сохранен в хранилище {key}: {e}")
+            return
+
+        with self._lock:
+            if key not in self._index:
+                self._index[key] = (target, size)
+                self._size += size
+            self._evict()
+
+    def get_stats(self):
+        with self._lock:
+            self._load()
+            return len(self._index), self._size
+
+track_store = TrackStore()
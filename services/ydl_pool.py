@@ -0,0 +1,146 @@
+import os
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+import yt_dlp
+from yt_dlp.extractor import gen_extractor_classes
+from yt_dlp.extractor.soundcloud import SoundcloudBaseIE
+
+from config import DOWNLOAD_POOL_WORKERS, MAX_CONCURRENT_DOWNLOADS, PREVIEW_WORKERS, SEARCH_WORKERS
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+ydl_checkouts = registry.counter("bot_ydl_pool_checkouts_total", "Выдача экземпляров YoutubeDL из пула")
+
+# 🔥 ПРОФИЛИ: одинаковые опции — один набор переиспользуемых экземпляров
+# id в имени: треки с одинаковым названием качаются в одну папку параллельно
+TRACK_OUTTMPL = '%(title).80s [%(id)s].%(ext)s'
+
+# Таймауты и повторы внутри yt-dlp: зависшее соединение обрывается в самом потоке
+TRACK_SOCKET_TIMEOUT = int(os.environ.get("TRACK_SOCKET_TIMEOUT", "30"))
+TRACK_NETWORK_OPTS = {
+    'socket_timeout': TRACK_SOCKET_TIMEOUT,
+    'extractor_retries': 2,
+    'fragment_retries': 3,
+}
+
+COMMON_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'ignoreerrors': True,
+    'retries': 2,
+}
+
+PROFILES = {
+    # Превью, список треков плейлиста и поиск — по экземпляру на поток этих пулов
+    'flat': (dict(COMMON_OPTS, extract_flat=True), SEARCH_WORKERS + PREVIEW_WORKERS),
+    # Один трек в папку попытки (папка задается на вызов через paths)
+    'track': (
+        dict(COMMON_OPTS, **TRACK_NETWORK_OPTS, outtmpl=TRACK_OUTTMPL, format='bestaudio[ext=mp3]/bestaudio/best', noplaylist=True),
+        DOWNLOAD_POOL_WORKERS,
+    ),
+    # Старый путь: весь плейлист одним download()
+    'playlist': (
+        dict(COMMON_OPTS, **TRACK_NETWORK_OPTS, outtmpl=TRACK_OUTTMPL, format='bestaudio[ext=mp3]/bestaudio/best'),
+        MAX_CONCURRENT_DOWNLOADS,
+    ),
+}
+
+# gen_extractor_classes отдает ленивые обертки — настоящий класс в real_class
+SOUNDCLOUD_IE_KEYS = [
+    ie.ie_key() for ie in gen_extractor_classes()
+    if ie.ie_key().startswith('Soundcloud') and issubclass(getattr(ie, 'real_class', ie), SoundcloudBaseIE)
+]
+
+class YDLPool:
+    """Долгоживущие экземпляры YoutubeDL по профилям опций.
+
+    Экземпляр выдается одному потоку за раз. Если свободных нет, создается
+    новый — вызов не ждет; при возврате сверх размера профиля лишние
+    выбрасываются. client_id SoundCloud общий для всех экземпляров: если
+    экстрактор обновил его во время вызова, остальные получат новый при
+    следующей выдаче вместо повторного похода за ним.
+    """
+
+    def __init__(self, profiles=PROFILES):
+        self._profiles = {name: (opts, max(1, size)) for name, (opts, size) in profiles.items()}
+        self._idle = {name: queue.LifoQueue() for name in self._profiles}
+        self._lock = threading.Lock()
+        self._client_id = None
+
+    def _create(self, profile):
+        opts, _ = self._profiles[profile]
+        ydl = yt_dlp.YoutubeDL(dict(opts))
+        # Экстракторы SoundCloud инициализируем сразу, чтобы они не перечитали client_id позже
+        for key in SOUNDCLOUD_IE_KEYS:
+            ie = ydl.get_info_extractor(key)
+            ie.initialize()
+            with self._lock:
+                if self._client_id is None:
+                    self._client_id = ie._CLIENT_ID
+        return ydl
+
+    def _soundcloud_ies(self, ydl):
+        for key in SOUNDCLOUD_IE_KEYS:
+            ie = ydl._ies_instances.get(key)
+            if ie is not None:
+                yield ie
+
+    def acquire(self, profile, output_dir=None):
+        try:
+            ydl = self._idle[profile].get_nowait()
+            ydl_checkouts.inc(profile=profile, result="reused")
+        except queue.Empty:
+            ydl = self._create(profile)
+            ydl_checkouts.inc(profile=profile, result="created")
+
+        with self._lock:
+            client_id = self._client_id
+        for ie in self._soundcloud_ies(ydl):
+            ie._CLIENT_ID = client_id
+        # Выданный id: при возврате принимаем только то, что экстрактор обновил сам
+        ydl._pool_client_id = client_id
+
+        ydl.params['paths'] = {'home': output_dir} if output_dir else {}
+        return ydl
+
+    def release(self, profile, ydl):
+        issued = getattr(ydl, '_pool_client_id', None)
+        with self._lock:
+            for ie in self._soundcloud_ies(ydl):
+                if ie._CLIENT_ID != issued:
+                    logger.info("client_id SoundCloud обновлен, раздаю остальным экземплярам")
+                    self._client_id = ie._CLIENT_ID
+                    break
+
+        _, size = self._profiles[profile]
+        if self._idle[profile].qsize() < size:
+            self._idle[profile].put_nowait(ydl)
+        else:
+            ydl.close()
+
+    @contextmanager
+    def checkout(self, profile, output_dir=None):
+        ydl = self.acquire(profile, output_dir)
+        try:
+            yield ydl
+        finally:
+            self.release(profile, ydl)
+
+    def warm_up(self, refresh_client_id=True):
+        """Создает по экземпляру на профиль и при необходимости заранее получает client_id"""
+        for profile in self._profiles:
+            with self.checkout(profile) as ydl:
+                if refresh_client_id and profile == 'flat':
+                    ie = ydl.get_info_extractor(SOUNDCLOUD_IE_KEYS[0])
+                    if not ie.cache.load('soundcloud', 'client_id'):
+                        try:
+                            ie._update_client_id()
+                        except Exception as e:
+                            logger.warning(f"Не удалось заранее получить client_id SoundCloud: {e}")
+        logger.info(f"🔥 Пул YoutubeDL прогрет: {', '.join(self._profiles)}")
+
+ydl_pool = YDLPool()
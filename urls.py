@@ -0,0 +1,94 @@
+import logging
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from core import LRUCache, SingleFlight
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 🔥 КАНОНИЧЕСКИЕ ССЫЛКИ: один плейлист = один ключ в кэшах и истории
+HOST_ALIASES = {
+    'www.soundcloud.com': 'soundcloud.com',
+    'm.soundcloud.com': 'soundcloud.com',
+    'mobi.soundcloud.com': 'soundcloud.com',
+}
+
+# Короткие ссылки из приложения — раскрываются редиректом
+SHORT_LINK_HOSTS = ('on.soundcloud.com', 'snd.sc')
+
+TRACKING_PARAMS = {'si', 'ref', 'in', 'p', 'c', 'fbclid', 'gclid', 'feature'}
+TRACKING_PREFIXES = ('utm_',)
+
+SHORT_LINK_TIMEOUT = 10
+
+short_link_lookups = registry.counter("bot_short_link_lookups_total", "Раскрытие коротких ссылок")
+
+_resolved = LRUCache(10000)
+_flights = SingleFlight("short_link")
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def is_soundcloud_host(host):
+    return host == 'soundcloud.com' or host.endswith('.soundcloud.com') or host in SHORT_LINK_HOSTS
+
+def canonicalize_url(url):
+    """Приводит ссылку к одному виду без сети.
+
+    Ссылки SoundCloud: https, хост в нижнем регистре без www./m., без
+    трекинговых параметров, фрагмента и слеша в конце. Короткие ссылки
+    остаются короткими — их раскрывает resolve_url. У остальных сайтов
+    параметры могут значить содержимое, поэтому там меняются только схема
+    и регистр хоста.
+    """
+    url = (url or '').strip()
+    if '://' not in url:
+        url = f"https://{url}"
+
+    parsed = urlsplit(url)
+    host = parsed.netloc.lower()
+    scheme = 'https' if parsed.scheme in ('http', 'https') else parsed.scheme.lower()
+
+    if not is_soundcloud_host(host):
+        return urlunsplit((scheme, host, parsed.path, parsed.query, parsed.fragment))
+
+    host = HOST_ALIASES.get(host, host)
+    query = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True) if not _is_tracking_param(key)]
+    path = parsed.path.rstrip('/')
+
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ''))
+
+def is_short_link(url):
+    return urlsplit(canonicalize_url(url)).netloc in SHORT_LINK_HOSTS
+
+async def _follow_redirects(url):
+    timeout = aiohttp.ClientTimeout(total=SHORT_LINK_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(url, allow_redirects=True) as response:
+            return str(response.url)
+
+async def resolve_url(url):
+    """Каноническая ссылка; короткие раскрываются один раз и запоминаются"""
+    canonical = canonicalize_url(url)
+    if urlsplit(canonical).netloc not in SHORT_LINK_HOSTS:
+        return canonical
+
+    resolved = _resolved.get(canonical)
+    if resolved:
+        short_link_lookups.inc(result="memo")
+        return resolved
+
+    try:
+        target = await _flights.do(canonical, lambda: _follow_redirects(canonical))
+    except Exception as e:
+        short_link_lookups.inc(result="error")
+        logger.warning(f"Не удалось раскрыть короткую ссылку {canonical}: {e}")
+        return canonical
+
+    resolved = canonicalize_url(target)
+    _resolved.set(canonical, resolved)
+    short_link_lookups.inc(result="resolved")
+    return resolved
@@ -1,23 +1,53 @@
 from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import FSInputFile, CallbackQuery
 from config import AD_MESSAGE
 from keyboards.main import get_ad_keyboard
 from lang_bot.translations import get_text
 from core import db_manager
+from urls import canonicalize_url
+from urllib.parse import urlsplit
+from metrics import telegram_send_seconds, telegram_send_errors
 
 async def send_message_to_user(bot: Bot, user_id: int, text: str, lang=None):
     try:
-        await bot.send_message(user_id, text)
+        with telegram_send_seconds.time(method="send_message"):
+            await bot.send_message(user_id, text)
     except Exception as e:
+        telegram_send_errors.inc(method="send_message")
         if lang is None:
             lang = await get_user_language_safe(user_id)
         error_text = get_text(lang, "failed_send_message")
         print(f"{error_text} {user_id}: {e}")
 
 async def send_document_to_user(bot: Bot, user_id: int, document, caption: str = "", lang=None):
+    """Отправляет документ, возвращает отправленное сообщение или None"""
     try:
-        await bot.send_document(user_id, document, caption=caption)
+        with telegram_send_seconds.time(method="send_document"):
+            return await bot.send_document(user_id, document, caption=caption)
     except Exception as e:
+        telegram_send_errors.inc(method="send_document")
+        if lang is None:
+            lang = await get_user_language_safe(user_id)
+        error_text = get_text(lang, "failed_send_document")
+        print(f"{error_text} {user_id}: {e}")
+
+async def send_cached_file_to_user(bot: Bot, user_id: int, file_id: str, media_type: str, caption: str = "", lang=None):
+    """Пересылает сохраненный file_id тем же методом, каким он был получен.
+    
+    Возвращает сообщение или None. TelegramBadRequest пробрасывается: для
+    сохраненного file_id это значит, что запись в кэше больше не годится.
+    Блокировка бота, сеть и флуд-лимит к file_id отношения не имеют.
+    """
+    method = "send_audio" if media_type == "audio" else "send_document"
+    try:
+        with telegram_send_seconds.time(method=method):
+            return await getattr(bot, method)(user_id, file_id, caption=caption)
+    except TelegramBadRequest:
+        telegram_send_errors.inc(method=method)
+        raise
+    except Exception as e:
+        telegram_send_errors.inc(method=method)
         if lang is None:
             lang = await get_user_language_safe(user_id)
         error_text = get_text(lang, "failed_send_document")
@@ -25,13 +55,15 @@ async def send_document_to_user(bot: Bot, user_id: int, document, caption: str =
 
 async def send_ad_message(bot: Bot, user_id: int, lang: str = "ua"):
     try:
-        await bot.send_message(
-            user_id,
-            AD_MESSAGE.get(lang, AD_MESSAGE["ua"]),
-            reply_markup=get_ad_keyboard(lang),
-            parse_mode="Markdown"
-        )
+        with telegram_send_seconds.time(method="send_ad"):
+            await bot.send_message(
+                user_id,
+                AD_MESSAGE.get(lang, AD_MESSAGE["ua"]),
+                reply_markup=get_ad_keyboard(lang),
+                parse_mode="Markdown"
+            )
     except Exception as e:
+        telegram_send_errors.inc(method="send_ad")
         if lang is None:
             lang = await get_user_language_safe(user_id)
         error_text = get_text(lang, "failed_send_ad")
@@ -65,8 +97,8 @@ def is_valid_url(text):
     
     if ' ' in text or '\n' in text:
         return False
-        
-    return True
+    
+    return '.' in urlsplit(canonicalize_url(text)).netloc
 
 async def safe_db_operation(operation, fallback=None):
     """Универсальная функция для безопасных операций с БД"""